@@ -0,0 +1,390 @@
+"""Offline replay and load benchmark for the polling pipeline.
+
+Replays a sequence of listings snapshots (the checked-in previous_data.json grown
+synthetically to --listings entries, then mutated every cycle) from a local HTTP
+stand-in, runs process_source -> outbox -> dispatcher against a fake
+Discord client (or, with --webhooks, a local webhook endpoint) with configurable
+latency and 429s, and reports per-cycle latency, delivery throughput, peak RSS
+and asyncio task counts.
+
+Example:
+    python benchmark.py --listings 100000 --guilds 2000 --cycles 5 --send-rate 5000
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from aiohttp import web
+
+BASE_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'previous_data.json')
+SEASONS = ["Summer 2026", "Fall 2025", "Winter 2026", "Spring 2026"]
+LOCATIONS = ["New York, NY", "San Francisco, CA", "Seattle, WA", "Austin, TX", "Remote", "Toronto, ON"]
+SOURCE_NAMES = ["vanshb03", "simplify"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay listings snapshots through the bot pipeline under load.")
+    parser.add_argument('--listings', type=int, default=10000, help="Listings per source after synthetic growth")
+    parser.add_argument('--guilds', type=int, default=500, help="Simulated guilds, one notification channel each")
+    parser.add_argument('--cycles', type=int, default=3, help="Changed snapshots replayed after the baseline")
+    parser.add_argument('--idle-cycles', type=int, default=1, help="Unchanged polls replayed after the changed ones")
+    parser.add_argument('--new-per-cycle', type=int, default=50, help="Listings added per source per cycle")
+    parser.add_argument('--deactivated-per-cycle', type=int, default=20, help="Listings deactivated per source per cycle")
+    parser.add_argument('--reactivated-per-cycle', type=int, default=5, help="Listings reactivated per source per cycle")
+    parser.add_argument('--send-latency-ms', type=float, default=5.0, help="Simulated channel.send latency")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.01, help="Fraction of sends answered with a 429")
+    parser.add_argument('--retry-after', type=float, default=0.05, help="retry_after of simulated 429s, in seconds")
+    parser.add_argument('--send-rate', type=float, default=None, help="Override GLOBAL_SEND_RATE for the run")
+    parser.add_argument('--webhooks', action='store_true', help="Deliver through channel webhooks POSTed to a local stand-in")
+    parser.add_argument('--port', type=int, default=8799, help="Port of the local listings stand-in (webhooks use port + 1)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    parser.add_argument('--verbose', action='store_true', help="Show the bot's own log output")
+    return parser.parse_args()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# --- Synthetic listings ---
+def synthetic_role(rng: random.Random, source_name: str, index: int, companies: list[str]) -> dict:
+    now = int(time.time())
+    company = rng.choice(companies)
+    return {
+        'date_updated': now,
+        'url': f"https://jobs.example.com/{source_name}/{index}",
+        'locations': rng.sample(LOCATIONS, rng.randint(1, 2)),
+        'sponsorship': rng.choice(["Other", "Offers Sponsorship", "Does Not Offer Sponsorship"]),
+        'active': True,
+        'company_name': company,
+        'title': f"Software Engineer Intern {index}",
+        'season': rng.choice(SEASONS),
+        'source': source_name,
+        'id': f"{source_name}-synthetic-{index}",
+        'date_posted': now,
+        'company_url': '',
+        'is_visible': True,
+    }
+
+
+def build_baseline(rng: random.Random, source_name: str, size: int, companies: list[str]) -> list[dict]:
+    with open(BASE_SNAPSHOT, 'r', encoding='utf-8') as file:
+        roles = [dict(role, id=f"{source_name}-{role['id']}") for role in json.load(file)]
+    for index in range(len(roles), size):
+        roles.append(synthetic_role(rng, source_name, index, companies))
+    return roles[:size]
+
+
+def mutate(rng: random.Random, roles: list[dict], source_name: str, args, companies: list[str], cycle: int) -> list[dict]:
+    roles = copy.copy(roles)
+    active = [index for index, role in enumerate(roles) if role.get('active')]
+    inactive = [index for index, role in enumerate(roles) if not role.get('active')]
+    for index in rng.sample(active, min(args.deactivated_per_cycle, len(active))):
+        roles[index] = dict(roles[index], active=False)
+    for index in rng.sample(inactive, min(args.reactivated_per_cycle, len(inactive))):
+        roles[index] = dict(roles[index], active=True)
+    for offset in range(args.new_per_cycle):
+        roles.append(synthetic_role(rng, source_name, 10_000_000 + cycle * 100_000 + offset, companies))
+    return roles
+
+
+# --- Local listings stand-in ---
+class ListingsServer:
+    """Serves one JSON body per source with an ETag, answering conditional requests with 304"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.bodies: dict[str, tuple[bytes, str]] = {}
+        self.bytes_served = 0
+        self._runner = None
+
+    def publish(self, source_name: str, roles: list[dict], version: int):
+        self.bodies[source_name] = (json.dumps(roles).encode('utf-8'), f'"{source_name}-{version}"')
+
+    def url(self, source_name: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{source_name}/listings.json"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body, etag = self.bodies[request.match_info['source']]
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        self.bytes_served += len(body)
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{source}/listings.json', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+# --- Fake Discord ---
+class FakeDiscord:
+    """Stands in for client.get_channel: every channel sends after a fixed latency and
+    answers a configurable fraction of sends with a 429"""
+
+    def __init__(self, discord_module, latency: float, rate_limit_ratio: float, retry_after: float, rng: random.Random):
+        self.discord = discord_module
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.rng = rng
+        self.sent = 0
+        self.rate_limited = 0
+        self.send_latencies: list[float] = []
+        self._channels = {}
+        fake = self
+
+        class FakeChannel(discord_module.TextChannel):
+            def __init__(self, channel_id: int):
+                self._fake_id = channel_id
+
+            async def send(self, content: str):
+                return await fake.send(self._fake_id, content)
+
+        self._channel_class = FakeChannel
+
+    def get_channel(self, channel_id: int):
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._channels[channel_id] = self._channel_class(channel_id)
+        return channel
+
+    async def send(self, channel_id: int, content: str):
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            response = SimpleNamespace(status=429, reason='Too Many Requests', headers={'Retry-After': str(self.retry_after)})
+            raise self.discord.HTTPException(response, 'You are being rate limited.')
+        self.sent += 1
+        self.send_latencies.append(time.perf_counter() - started)
+
+
+class FakeWebhookServer:
+    """Local stand-in for Discord's execute-webhook endpoint, with the same latency, 429 and
+    counter behavior as FakeDiscord. Reports each webhook's remaining requests in rate limit headers."""
+
+    def __init__(self, port: int, latency: float, rate_limit_ratio: float, retry_after: float, rng: random.Random):
+        self.port = port
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.rng = rng
+        self.sent = 0
+        self.rate_limited = 0
+        self.send_latencies: list[float] = []
+        self._runner = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.rate_limit_ratio:
+            self.rate_limited += 1
+            return web.json_response(
+                {'message': 'You are being rate limited.', 'retry_after': self.retry_after, 'global': False},
+                status=429, headers={'Retry-After': str(self.retry_after), 'X-RateLimit-Remaining': '0',
+                                     'X-RateLimit-Reset-After': str(self.retry_after)},
+            )
+        if not payload.get('content'):
+            return web.json_response({'message': 'Cannot send an empty message'}, status=400)
+        self.sent += 1
+        self.send_latencies.append(time.perf_counter() - started)
+        return web.Response(status=204, headers={'X-RateLimit-Remaining': '4', 'X-RateLimit-Reset-After': '0.4'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/webhooks/{webhook_id}/{token}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def poll_sources(mainbot):
+    """Polls every source once, concurrently, through the same process_source as the production poll loops"""
+    await asyncio.gather(*(mainbot.process_source(source) for source in mainbot.SOURCES))
+
+
+async def wait_for_delivery(mainbot):
+    """Drains the outbox until no pending rows are left and the dispatcher is idle"""
+    while True:
+        await mainbot.drain_outbox()
+        await mainbot.dispatcher.join()
+        if not mainbot.outbox_in_flight and await mainbot.drain_outbox() == 0 and not mainbot.outbox_in_flight:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def run_benchmark(args, mainbot) -> dict:
+    import discord
+
+    rng = random.Random(args.seed)
+    companies = list(mainbot.BIG_TECH_COMPANIES) + [f"Startup {index}" for index in range(500)]
+    if args.webhooks:
+        fake = FakeWebhookServer(args.port + 1, args.send_latency_ms / 1000, args.rate_limit_ratio, args.retry_after, rng)
+        await fake.start()
+        mainbot.WEBHOOK_API_BASE = fake.api_base
+        send_func = mainbot.send_webhook_message
+    else:
+        fake = FakeDiscord(discord, args.send_latency_ms / 1000, args.rate_limit_ratio, args.retry_after, rng)
+        mainbot.client.get_channel = fake.get_channel
+        send_func = mainbot.send_discord_message
+    if args.send_rate or args.webhooks:
+        rate = args.send_rate or mainbot.WEBHOOK_GLOBAL_SEND_RATE
+        mainbot.dispatcher = mainbot.DeliveryDispatcher(send_func, rate=rate, burst=rate)
+
+    server = ListingsServer(args.port)
+    await server.start()
+    await mainbot.init_db()
+
+    # Baseline snapshots are imported silently from legacy files, like a deploy over existing data
+    feeds = {}
+    sources = []
+    for index, source_name in enumerate(SOURCE_NAMES):
+        feeds[source_name] = build_baseline(rng, source_name, args.listings, companies)
+        legacy_file = f"{source_name}_baseline.json"
+        with open(legacy_file, 'w', encoding='utf-8') as file:
+            json.dump(feeds[source_name], file)
+        server.publish(source_name, feeds[source_name], 0)
+        sources.append(mainbot.ListingSource(source_name, server.url(source_name), legacy_file, track_reactivations=index == 1))
+    mainbot.SOURCES = sources
+
+    async with mainbot.async_session() as session:
+        async with session.begin():
+            await session.execute(
+                mainbot.sqlite_insert(mainbot.GuildConfig),
+                [{'guild_id': guild_id, 'channel_id': 1_000_000 + guild_id, 'ping_role_id': 5_000_000 + guild_id}
+                 for guild_id in range(1, args.guilds + 1)],
+            )
+            if args.webhooks:
+                await session.execute(
+                    mainbot.sqlite_insert(mainbot.ChannelWebhook),
+                    [{'channel_id': 1_000_000 + guild_id, 'guild_id': guild_id, 'webhook_id': 9_000_000 + guild_id,
+                      'webhook_token': f"token-{guild_id}"} for guild_id in range(1, args.guilds + 1)],
+                )
+
+    max_tasks = 0
+    max_loop_lag = 0.0  # Longest time the event loop was blocked past a 10 ms sleep, per cycle
+
+    async def sample_tasks():
+        nonlocal max_tasks, max_loop_lag
+        while True:
+            max_tasks = max(max_tasks, len(asyncio.all_tasks()))
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_loop_lag = max(max_loop_lag, time.perf_counter() - started - 0.01)
+
+    sampler = asyncio.create_task(sample_tasks())
+    cycles = []
+    try:
+        await poll_sources(mainbot)  # Imports the baseline; nothing is announced
+        total_cycles = args.cycles + args.idle_cycles
+        for cycle in range(1, total_cycles + 1):
+            changed = cycle <= args.cycles
+            if changed:
+                for source_name in SOURCE_NAMES:
+                    feeds[source_name] = mutate(rng, feeds[source_name], source_name, args, companies, cycle)
+                    server.publish(source_name, feeds[source_name], cycle)
+
+            sent_before, limited_before, bytes_before = fake.sent, fake.rate_limited, server.bytes_served
+            fake.send_latencies = []
+            max_loop_lag = 0.0
+            started = time.perf_counter()
+            await poll_sources(mainbot)
+            cycle_seconds = time.perf_counter() - started
+            await wait_for_delivery(mainbot)
+            total_seconds = time.perf_counter() - started
+
+            messages = fake.sent - sent_before
+            cycles.append({
+                'cycle': cycle,
+                'changed': changed,
+                'bytes_fetched': server.bytes_served - bytes_before,
+                'cycle_seconds': round(cycle_seconds, 3),
+                'delivery_seconds': round(total_seconds - cycle_seconds, 3),
+                'messages_sent': messages,
+                'messages_per_second': round(messages / total_seconds, 1) if total_seconds else 0.0,
+                'rate_limited': fake.rate_limited - limited_before,
+                'send_p50_ms': round(percentile(fake.send_latencies, 0.5) * 1000, 2),
+                'send_p99_ms': round(percentile(fake.send_latencies, 0.99) * 1000, 2),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                'max_tasks': max_tasks,
+                'max_loop_lag_ms': round(max_loop_lag * 1000, 1),
+            })
+    finally:
+        sampler.cancel()
+        await server.stop()
+        if args.webhooks:
+            await fake.stop()
+        await mainbot.cleanup_db()
+
+    return {
+        'listings_per_source': args.listings,
+        'guilds': args.guilds,
+        'cycles': cycles,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'max_tasks': max_tasks,
+    }
+
+
+def print_report(report: dict):
+    print(f"Listings per source: {report['listings_per_source']}, guilds: {report['guilds']}")
+    columns = ['cycle', 'changed', 'bytes_fetched', 'cycle_seconds', 'delivery_seconds', 'messages_sent',
+               'messages_per_second', 'rate_limited', 'send_p50_ms', 'send_p99_ms', 'peak_rss_mb', 'max_tasks',
+               'max_loop_lag_ms']
+    print(' | '.join(columns))
+    for cycle in report['cycles']:
+        print(' | '.join(str(cycle[column]) for column in columns))
+    print(f"Peak RSS: {report['peak_rss_mb']} MB, max concurrent asyncio tasks: {report['max_tasks']}")
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='internships-bench-')
+    os.chdir(workdir)  # bot_config.db and legacy snapshots are created here
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    log_target = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with log_target:
+        import mainbot
+        report = asyncio.run(run_benchmark(args, mainbot))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    print(f"Working directory: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,125 @@
 import json
 import os
+import re
+import sys
+import codecs
+import hashlib
+import tempfile
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from datetime import datetime
-import schedule
 import discord
 from discord import app_commands
 import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 import tracemalloc
 import resource
 import aiohttp
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy import Column, Integer, select
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy import Column, Integer, String, Boolean, Text, Float, Index, select, delete, update, func, true, text, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Start tracing Python memory allocations
-tracemalloc.start()
+# Tracing every allocation slows the whole bot down, so memory profiling is opt-in; it can also be
+# switched on and off at runtime with /memory_profile or POST /memory on the metrics endpoint
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "false").lower() == "true"
+if PROFILE_MEMORY:
+    tracemalloc.start()
 
 # Constants
 JSON_URL_1 = 'https://raw.githubusercontent.com/vanshb03/Summer2026-Internships/refs/heads/dev/.github/scripts/listings.json'
 JSON_URL_2 = 'https://raw.githubusercontent.com/SimplifyJobs/Summer2025-Internships/refs/heads/dev/.github/scripts/listings.json'
 PREVIOUS_DATA_FILE = 'previous_data.json'
 PREVIOUS_DATA_FILE_2 = 'previous_data_simplify.json'
+SOURCES_FILE = os.getenv("SOURCES_FILE", "sources.json")
+ANNOUNCE_UPDATES = os.getenv("ANNOUNCE_UPDATES", "false").lower() == "true"  # Also post material edits of listings
 
 DISCORD_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_FILE = 'bot_config.db'
 DATABASE_URL = f'sqlite+aiosqlite:///{DATABASE_FILE}'
 MAX_RETRIES = 3
+# Sharding: WORKER_PROCESSES > 1 launches one bot process per partition of shards. Process 0 is the
+# primary: it polls the sources and syncs commands; every process delivers the outbox rows of its own guilds.
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or (WORKER_PROCESSES if WORKER_PROCESSES > 1 else 0)  # 0: unsharded
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()] or None  # Set by the launcher
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+IS_PRIMARY_PROCESS = WORKER_INDEX == 0
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics on this port; 0 disables the endpoint
+SNAPSHOT_QUERY_BATCH_SIZE = 500  # Ids per IN (...) query, well below SQLite's variable limit
+
+# HTTP fetch settings (one pooled session is reused across polls)
+HTTP_TIMEOUT_SECONDS = 30
+HTTP_CONNECTION_LIMIT = 10
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read per step when streaming listings payloads
+PIPELINE_THREADS = 2  # Worker threads for parsing, fingerprinting and diffing, off the event loop
+RENDER_YIELD_ROWS = 2000  # Outbox rows built between yields to the event loop
+
+# Delivery settings (Discord allows 50 requests/second globally and ~5 messages/5s per channel)
+GLOBAL_SEND_RATE = 40  # Messages per second across all channels
+GLOBAL_SEND_BURST = 40
+CHANNEL_QUEUE_SIZE = 200  # Pending messages per channel before enqueueing waits
+MAX_PENDING_DELIVERIES = 20000  # Pending messages overall before enqueueing waits
+CHANNEL_WORKER_IDLE_SECONDS = 30  # Idle channel workers exit after this long
+DISCORD_MESSAGE_LIMIT = 2000  # Characters per message
+DIGEST_MODE = os.getenv("DIGEST_MODE", "true").lower() == "true"  # Pack each cycle's messages per channel
+DIGEST_MAX_ITEMS_PER_CHANNEL = 25  # Catch-up rows shown per channel and drain; the rest is summarized as "...and N more"
+DIGEST_BACKLOG_SECONDS = 10 * 60  # Rows older than this at drain time are catch-up after downtime, not the current cycle
+DIGEST_SEPARATOR = "\n\n"
+MAX_RATELIMIT_WAIT = 30.0  # Longer per-route waits raise discord.RateLimited instead of blocking the send
+
+# Webhook delivery: with DELIVERY_MODE=webhook, /set_channel creates a webhook in the channel and notifications
+# are POSTed to it over the shared HTTP session, without resolving channels through the gateway client
+WEBHOOK_DELIVERY = os.getenv("DELIVERY_MODE", "gateway").lower() == "webhook"
+WEBHOOK_API_BASE = os.getenv("WEBHOOK_API_BASE", "https://discord.com/api/v10")  # Overridable for a local stand-in
+WEBHOOK_NAME = "Internship Notifications"
+WEBHOOK_SEND_RATE = 2.5  # Messages per second per webhook (Discord allows about 5 per 2 seconds)
+WEBHOOK_SEND_BURST = 5
+WEBHOOK_GLOBAL_SEND_RATE = 200  # Webhook executions do not count against the bot's global limit; this only caps request volume
+
+# Notification outbox settings
+OUTBOX_POLL_SECONDS = 5  # How often the outbox worker checks for due messages without a wakeup
+OUTBOX_CHANNELS_PER_DRAIN = 100  # Channels claimed per drain, each with all of its due rows
+OUTBOX_CLAIM_SECONDS = 15 * 60  # Claimed rows not settled by then are claimed again: re-sent after a crash, or lease renewed if still queued
+OUTBOX_MAX_ATTEMPTS = 5  # Failed deliveries before a row is given up
+OUTBOX_RETRY_BASE_SECONDS = 30  # First retry delay, doubled per attempt
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 3600  # Settled rows (and their idempotency keys) are kept this long
+
+# Polling schedule (per source; overridable in sources.json)
+POLL_INTERVAL_SECONDS = 60  # Starting interval
+POLL_MIN_INTERVAL_SECONDS = 30  # Interval right after a source changed
+POLL_MAX_INTERVAL_SECONDS = 300  # Ceiling a quiet source backs off to
+POLL_BACKOFF_FACTOR = 1.5  # Interval growth per poll without changes
+POLL_JITTER_RATIO = 0.1  # Random +/- fraction applied to every interval
+MEMORY_REPORT_SECONDS = 300
+MEMORY_PROFILE_TOP = 10  # Call sites listed per section of a memory profile report
+
+# Channel health
+CHANNEL_BACKOFF_BASE_SECONDS = 300  # First block after a channel is found unusable, doubled per failed probe
+CHANNEL_BACKOFF_MAX_SECONDS = 24 * 3600
+CHANNEL_PRUNE_DAYS = 14  # Channels gone (deleted, forbidden) for this long are unconfigured
+CHANNEL_WARMUP_CONCURRENCY = 10  # Uncached channels fetched at once when warming the channel cache on startup
+
+# Cross-source deduplication
+DEDUP_WINDOW_SECONDS = 3 * 24 * 3600  # A posting announced by one source is not announced again by another for this long
+DEDUP_TRACKING_PARAMS = frozenset({'ref', 'source', 'src', 'gh_src', 'referrer', 'lever-source', 'lever-origin'})
+
+# Listing search
+SEARCH_RESULT_LIMIT = 10  # Results per /search or /latest reply by default
+SEARCH_MAX_RESULTS = 25
+SEARCH_INDEX_SCAN_MATCHES = 1000  # Queries with at least this many matches are ranked by walking the date index
+
+# Listing history
+STATS_TOP_LIMIT = 10  # Rows per "top companies/seasons" /stats reply
 
 BIG_TECH_COMPANIES = [
     "openai", "anthropic", "google", "nvidia", "bloomberg", "snap",
@@ -41,10 +133,42 @@ BIG_TECH_COMPANIES = [
     "splunk", "reddit", "discord", "tiktok", "bytedance", "cruise", "waymo", "rivian", "lucid"
 ]
 
+@dataclass(frozen=True)
+class ListingSource:
+    """A listings feed that is polled and diffed against its own snapshot"""
+    name: str
+    url: str
+    snapshot_file: str  # Legacy JSON snapshot, imported into the snapshot store on first run
+    track_reactivations: bool = False  # Announce roles that become active again
+    poll_interval: float = POLL_INTERVAL_SECONDS
+    min_poll_interval: float = POLL_MIN_INTERVAL_SECONDS
+    max_poll_interval: float = POLL_MAX_INTERVAL_SECONDS
+
+DEFAULT_SOURCES = [
+    ListingSource(name="vanshb03", url=JSON_URL_1, snapshot_file=PREVIOUS_DATA_FILE),
+    ListingSource(name="simplify", url=JSON_URL_2, snapshot_file=PREVIOUS_DATA_FILE_2, track_reactivations=True),
+]
+
+def load_sources(sources_file: str = SOURCES_FILE) -> list[ListingSource]:
+    """Load the source registry from a JSON list of ListingSource fields, falling back to DEFAULT_SOURCES"""
+    if not os.path.exists(sources_file):
+        return list(DEFAULT_SOURCES)
+    try:
+        with open(sources_file, 'r', encoding='utf-8') as file:
+            sources = [ListingSource(**entry) for entry in json.load(file)]
+        print(f"Loaded {len(sources)} listing sources from {sources_file}.")
+        return sources
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"Error reading sources file {sources_file}: {e}. Using default sources.")
+        return list(DEFAULT_SOURCES)
+
+SOURCES = load_sources()
+
 # Emojis
 EMOJI_NEW = "✨"
 EMOJI_DEACTIVATED = "📉"
 EMOJI_REACTIVATED = "📈"
+EMOJI_UPDATED = "📝"
 EMOJI_SUMMER = "☀️"
 EMOJI_WINTER = "❄️"
 EMOJI_FALL = "🍂"
@@ -52,15 +176,149 @@ EMOJI_UNKNOWN_TERM = "❓"
 
 # Initialize Discord client and command tree
 intents = discord.Intents.default()
-client = discord.Client(intents=intents)
+if SHARD_COUNT:
+    client = discord.AutoShardedClient(
+        intents=intents, max_ratelimit_timeout=MAX_RATELIMIT_WAIT, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS
+    )
+else:
+    client = discord.Client(intents=intents, max_ratelimit_timeout=MAX_RATELIMIT_WAIT)
 tree = app_commands.CommandTree(client)
 
-# Global tracking for failed channels (in-memory for current session)
-failed_channels = set()
-channel_failure_counts = {}
-
-# Global flag to track if scheduled task is running
-is_task_running = False
+def shard_for_guild(guild_id: int, shard_count: int = SHARD_COUNT) -> int:
+    """Discord's shard assignment for a guild"""
+    return (guild_id >> 22) % shard_count if shard_count else 0
+
+# Shared HTTP session and conditional-request validators per URL
+http_session: aiohttp.ClientSession | None = None
+fetch_validators = {}  # url -> {'etag', 'last_modified', 'content_hash'} of the last processed response
+pending_fetch_validators = {}  # url -> validators of a fetched response not yet processed
+fetched_channels = {}  # channel_id -> channel resolved through the API, for channels not in the gateway cache
+pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_THREADS, thread_name_prefix="pipeline")
+
+async def run_in_pipeline(func, *args):
+    """Runs a CPU- or disk-bound pipeline stage on the pipeline threads, keeping the gateway heartbeat
+    and slash commands responsive. Stages only touch the objects passed to them."""
+    return await asyncio.get_running_loop().run_in_executor(pipeline_executor, func, *args)
+
+# --- Metrics ---
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metrics:
+    """In-process counters, gauges and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, prefix: str = "internships_bot"):
+        self.prefix = prefix
+        self._counters: dict[tuple, float] = {}  # (name, labels) -> value
+        self._gauges: dict[tuple, float] = {}
+        self._gauge_callbacks: dict[str, object] = {}  # name -> callable returning the current value
+        self._histograms: dict[tuple, list] = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._buckets: dict[str, tuple] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self._gauges[self._key(name, labels)] = value
+
+    def register_gauge(self, name: str, callback):
+        """Registers a gauge whose value is read from callback() at scrape time"""
+        self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float, buckets: tuple = DEFAULT_SECONDS_BUCKETS, **labels):
+        buckets = self._buckets.setdefault(name, buckets)
+        histogram = self._histograms.setdefault(self._key(name, labels), [[0] * len(buckets), 0.0, 0])
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        return self._counters.get(self._key(name, labels), 0)
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+            for key, value in labels
+        ) + "}"
+
+    def render(self) -> str:
+        lines = []
+        typed = set()
+
+        def type_line(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for (name, labels), value in sorted(self._counters.items()):
+            type_line(name, "counter")
+            lines.append(f"{self.prefix}_{name}{self._labels(labels)} {value}")
+        gauges = dict(self._gauges)
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                gauges[(name, ())] = callback()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+        for (name, labels), value in sorted(gauges.items()):
+            type_line(name, "gauge")
+            lines.append(f"{self.prefix}_{name}{self._labels(labels)} {value}")
+        for (name, labels), (bucket_counts, total, count) in sorted(self._histograms.items()):
+            type_line(name, "histogram")
+            for bound, bucket_count in zip(self._buckets[name], bucket_counts):
+                lines.append(f"{self.prefix}_{name}_bucket{self._labels(labels + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.prefix}_{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.prefix}_{name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{self.prefix}_{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+async def _metrics_handler(request):
+    from aiohttp import web
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def _memory_handler(request):
+    """GET: memory profile report. POST ?tracing=on|off: starts or stops allocation tracing first."""
+    from aiohttp import web
+    if request.method == "POST":
+        tracing = request.query.get("tracing")
+        if tracing == "on":
+            memory_profiler.start()
+        elif tracing == "off":
+            memory_profiler.stop()
+        else:
+            return web.Response(status=400, text="Expected ?tracing=on or ?tracing=off\n")
+    return web.Response(text=await memory_profiler.report() + "\n", content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serves GET /metrics and the /memory profiling report on a local port"""
+    from aiohttp import web  # Only imported when the endpoint is enabled
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    app.router.add_get("/memory", _memory_handler)
+    app.router.add_post("/memory", _memory_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics endpoint listening on http://{host}:{port}/metrics (memory profile at /memory)")
+    return runner
 
 # --- SQLAlchemy Setup ---
 Base = declarative_base()
@@ -72,18 +330,389 @@ class GuildConfig(Base):
     channel_id = Column(Integer, nullable=True)
     ping_role_id = Column(Integer, nullable=True)
 
+class BotState(Base):
+    """Small key/value store for process-wide state such as the guild configuration version"""
+    __tablename__ = 'bot_state'
+
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)
+
+GUILD_CONFIG_VERSION_KEY = 'guild_config_version'
+COMMAND_TREE_HASH_KEY = 'command_tree_hash'
+
+class GuildWatchlistEntry(Base):
+    """A company a guild wants pings for, in addition to BIG_TECH_COMPANIES"""
+    __tablename__ = 'guild_watchlist_entries'
+
+    guild_id = Column(Integer, primary_key=True)
+    company = Column(String, primary_key=True)  # Normalized with normalize_company_term
+
+FILTER_SEASON = 'season'
+FILTER_LOCATION = 'location'
+FILTER_SPONSORSHIP = 'sponsorship'
+FILTER_COMPANY = 'company'
+FILTER_KEYWORD = 'keyword'
+FILTER_FIELDS = (FILTER_SEASON, FILTER_LOCATION, FILTER_SPONSORSHIP, FILTER_COMPANY, FILTER_KEYWORD)
+
+class GuildSubscriptionFilter(Base):
+    """One accepted value of a guild's subscription filter. Values of the same field are alternatives;
+    a listing must match every field the guild filters on. Guilds without filters receive everything."""
+    __tablename__ = 'guild_subscription_filters'
+
+    guild_id = Column(Integer, primary_key=True)
+    field = Column(String, primary_key=True)  # One of FILTER_FIELDS
+    value = Column(String, primary_key=True)  # Normalized with normalize_filter_value
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_CLAIMED = 'claimed'  # Handed to the dispatcher; next_attempt_at holds the claim's expiry
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+OUTBOX_UNSETTLED = (OUTBOX_PENDING, OUTBOX_CLAIMED)
+
+class OutboxMessage(Base):
+    """One notification for one channel, written in the same transaction as the snapshot change that caused it"""
+    __tablename__ = 'notification_outbox'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idempotency_key = Column(String, nullable=False, unique=True)  # source:kind:listing:fingerprint:guild:channel
+    guild_id = Column(Integer, nullable=False)
+    channel_id = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default=OUTBOX_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(Float, nullable=False)
+    next_attempt_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),)
+
+class AnnouncementKey(Base):
+    """Dedup key of an announced posting (normalized URL, or company and title), per event kind.
+    A later event with the same key from another source within DEDUP_WINDOW_SECONDS is not announced."""
+    __tablename__ = 'announcement_keys'
+
+    kind = Column(String, primary_key=True)
+    dedup_key = Column(String, primary_key=True)
+    source = Column(String, nullable=False)
+    listing_id = Column(String, nullable=False)
+    announced_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index('ix_announcement_keys_announced_at', 'announced_at'),)
+
+class ChannelWebhook(Base):
+    """Webhook the bot created in a notification channel, used for delivery when WEBHOOK_DELIVERY is on"""
+    __tablename__ = 'channel_webhooks'
+
+    channel_id = Column(Integer, primary_key=True)
+    guild_id = Column(Integer, nullable=False)
+    webhook_id = Column(Integer, nullable=False)
+    webhook_token = Column(String, nullable=False)
+
+CHANNEL_GONE_REASONS = ('not_found', 'forbidden', 'not_text_channel')  # Failures that will not fix themselves
+
+class ChannelHealth(Base):
+    """Delivery failures of a configured channel. Healthy channels have no row."""
+    __tablename__ = 'channel_health'
+
+    guild_id = Column(Integer, primary_key=True)
+    channel_id = Column(Integer, primary_key=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=False)  # One of CHANNEL_GONE_REASONS, 'http_error' or 'error'
+    first_failed_at = Column(Float, nullable=False)
+    blocked_until = Column(Float, nullable=False, default=0)  # Deliveries are skipped until then; the next one re-probes
+
+class ListingSnapshot(Base):
+    """Last seen state of each listing, keyed by source and listing id"""
+    __tablename__ = 'listing_snapshots'
+
+    source = Column(String, primary_key=True)
+    listing_id = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # Hash of the listing's full content
+    active = Column(Boolean, nullable=False)
+    data = Column(Text, nullable=False)  # Compact JSON of the listing
+
+class ListingEventLog(Base):
+    """Append-only history of listing lifecycle events (new, deactivated, reactivated); rows are never updated"""
+    __tablename__ = 'listing_events'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String, nullable=False)
+    listing_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    company = Column(String, nullable=False)
+    season = Column(String, nullable=True)  # Season or terms as displayed, e.g. "Summer 2026, Fall 2026"
+    occurred_at = Column(Float, nullable=False)
+    duplicate = Column(Boolean, nullable=False, default=False)  # Already announced by another source; not in the rollups
+
+    __table_args__ = (
+        Index('ix_listing_events_listing', 'source', 'listing_id', 'occurred_at'),
+        Index('ix_listing_events_occurred_at', 'occurred_at'),
+    )
+
+ROLLUP_ALL = 'all'
+ROLLUP_COMPANY = 'company'
+ROLLUP_SEASON = 'season'
+
+class ListingEventRollup(Base):
+    """Event counts per period, incremented in the transaction that appends the events.
+    bucket is a day (2026-10-17), ISO week (2026-W42) or month (2026-10); value is '' for ROLLUP_ALL."""
+    __tablename__ = 'listing_event_rollups'
+
+    bucket = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    dimension = Column(String, primary_key=True)  # ROLLUP_ALL, ROLLUP_COMPANY or ROLLUP_SEASON
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index('ix_listing_event_rollups_top', 'bucket', 'dimension', 'kind', 'count'),)
+
 # Create async engine and session factory
 engine = create_async_engine(DATABASE_URL, echo=False)
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+@sqlalchemy_event.listens_for(engine.sync_engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets worker processes read the outbox while the primary writes, and avoids an fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 # --- Database Setup and Helper Functions ---
+def _parse_ping_role_id(guild_id: int, ping_role_id) -> int | None:
+    if not ping_role_id:
+        return None
+    try:
+        return int(ping_role_id)
+    except (ValueError, TypeError):
+        print(f"Warning: Invalid ping_role_id '{ping_role_id}' for guild {guild_id}. Treating as None.")
+        return None
+
+def normalize_filter_value(value: str) -> str:
+    return ' '.join(value.lower().split())
+
+class SubscriptionIndex:
+    """Inverted index from (field, value) to the guilds filtering on it. Matching a listing only
+    touches the postings of the listing's own attribute values, never the full guild list."""
+
+    def __init__(self):
+        self._postings: dict[tuple[str, str], set[int]] = {}  # (field, value) -> guild ids
+        self._filters: dict[int, dict[str, set[str]]] = {}  # guild_id -> field -> accepted values
+
+    def add(self, guild_id: int, filter_field: str, value: str):
+        self._filters.setdefault(guild_id, {}).setdefault(filter_field, set()).add(value)
+        self._postings.setdefault((filter_field, value), set()).add(guild_id)
+
+    def remove(self, guild_id: int, filter_field: str, value: str):
+        guild_filters = self._filters.get(guild_id, {})
+        guild_filters.get(filter_field, set()).discard(value)
+        if not guild_filters.get(filter_field):
+            guild_filters.pop(filter_field, None)
+        if not guild_filters:
+            self._filters.pop(guild_id, None)
+        postings = self._postings.get((filter_field, value))
+        if postings is not None:
+            postings.discard(guild_id)
+            if not postings:
+                del self._postings[(filter_field, value)]
+
+    def clear_guild(self, guild_id: int):
+        for filter_field, values in list(self._filters.get(guild_id, {}).items()):
+            for value in list(values):
+                self.remove(guild_id, filter_field, value)
+
+    def has_filters(self, guild_id: int) -> bool:
+        return guild_id in self._filters
+
+    def filters_for(self, guild_id: int) -> dict[str, set[str]]:
+        return self._filters.get(guild_id, {})
+
+    def values_for_field(self, filter_field: str) -> set[str]:
+        return {value for posting_field, value in self._postings if posting_field == filter_field}
+
+    def match(self, attributes: dict[str, set[str]]) -> set[int]:
+        """Filtered guilds whose every filtered field accepts one of the listing's attribute values"""
+        satisfied: dict[int, int] = {}  # guild_id -> number of its filtered fields matched so far
+        for filter_field, values in attributes.items():
+            field_guilds = set()
+            for value in values:
+                field_guilds |= self._postings.get((filter_field, value), set())
+            for guild_id in field_guilds:
+                satisfied[guild_id] = satisfied.get(guild_id, 0) + 1
+        return {guild_id for guild_id, count in satisfied.items() if count == len(self._filters[guild_id])}
+
+class GuildConfigCache:
+    """Process-wide copy of the GuildConfig rows. Loaded once on first use and kept
+    current by set_guild_channel / set_guild_ping_role, so per-cycle fan-out never queries SQLite."""
+
+    def __init__(self):
+        self._channels: dict[int, int] = {}  # guild_id -> channel_id
+        self._ping_roles: dict[int, int] = {}  # guild_id -> ping_role_id
+        self._watchlists: dict[int, set[str]] = {}  # guild_id -> watched company terms
+        self._webhooks: dict[int, tuple[int, str]] = {}  # channel_id -> (webhook_id, webhook_token)
+        self.subscriptions = SubscriptionIndex()
+        self.watchlist_version = 0  # Bumped whenever any watched or filtered company term changes
+        self._db_version = None  # GUILD_CONFIG_VERSION_KEY value the cache was loaded at
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            async with async_session() as session:
+                self._db_version = await session.scalar(
+                    select(BotState.value).where(BotState.key == GUILD_CONFIG_VERSION_KEY)
+                )
+                result = await session.execute(
+                    select(GuildConfig.guild_id, GuildConfig.channel_id, GuildConfig.ping_role_id)
+                )
+                for row in result:
+                    self._store(row.guild_id, row.channel_id, _parse_ping_role_id(row.guild_id, row.ping_role_id))
+                result = await session.execute(select(GuildWatchlistEntry.guild_id, GuildWatchlistEntry.company))
+                for row in result:
+                    self._watchlists.setdefault(row.guild_id, set()).add(row.company)
+                result = await session.execute(
+                    select(GuildSubscriptionFilter.guild_id, GuildSubscriptionFilter.field, GuildSubscriptionFilter.value)
+                )
+                for row in result:
+                    self.subscriptions.add(row.guild_id, row.field, row.value)
+                result = await session.execute(
+                    select(ChannelWebhook.channel_id, ChannelWebhook.webhook_id, ChannelWebhook.webhook_token)
+                )
+                for row in result:
+                    self._webhooks[row.channel_id] = (row.webhook_id, row.webhook_token)
+            self.watchlist_version += 1
+            self._loaded = True
+            print(f"Guild configuration cache loaded: {len(self._channels)} channels, {len(self._ping_roles)} ping roles, "
+                  f"{len(self._watchlists)} watchlists, {len(self.subscriptions._filters)} filtered guilds, "
+                  f"{len(self._webhooks)} webhooks.")
+
+    def _store(self, guild_id: int, channel_id: int | None, ping_role_id: int | None):
+        for mapping, value in ((self._channels, channel_id), (self._ping_roles, ping_role_id)):
+            if value:
+                mapping[guild_id] = value
+            else:
+                mapping.pop(guild_id, None)
+
+    async def refresh_if_stale(self):
+        """Reloads the cache if another process changed the guild configuration since it was loaded"""
+        if not self._loaded:
+            await self.ensure_loaded()
+            return
+        async with async_session() as session:
+            db_version = await session.scalar(select(BotState.value).where(BotState.key == GUILD_CONFIG_VERSION_KEY))
+        if db_version != self._db_version:
+            print("Guild configuration changed in another process, reloading cache.")
+            self.invalidate()
+            await self.ensure_loaded()
+
+    def mark_version(self, db_version: str):
+        """Records a version written by this process, so its own writes do not trigger a reload"""
+        self._db_version = db_version
+
+    def set_channel(self, guild_id: int, channel_id: int | None):
+        self._store(guild_id, channel_id, self._ping_roles.get(guild_id))
+
+    def set_ping_role(self, guild_id: int, ping_role_id: int | None):
+        self._store(guild_id, self._channels.get(guild_id), ping_role_id)
+
+    def set_webhook(self, channel_id: int, webhook: tuple[int, str] | None):
+        if webhook:
+            self._webhooks[channel_id] = webhook
+        else:
+            self._webhooks.pop(channel_id, None)
+
+    def set_watched(self, guild_id: int, company: str, watched: bool):
+        watchlist = self._watchlists.setdefault(guild_id, set())
+        if watched:
+            watchlist.add(company)
+        else:
+            watchlist.discard(company)
+        if not watchlist:
+            del self._watchlists[guild_id]
+        self.watchlist_version += 1
+
+    def set_filter(self, guild_id: int, field: str, value: str, enabled: bool):
+        if enabled:
+            self.subscriptions.add(guild_id, field, value)
+        else:
+            self.subscriptions.remove(guild_id, field, value)
+        if field == FILTER_COMPANY:
+            self.watchlist_version += 1
+
+    def clear_filters(self, guild_id: int):
+        self.subscriptions.clear_guild(guild_id)
+        self.watchlist_version += 1
+
+    def invalidate(self):
+        """Drops the cached rows; the next read reloads them from the database"""
+        self._channels = {}
+        self._ping_roles = {}
+        self._watchlists = {}
+        self._webhooks = {}
+        self.subscriptions = SubscriptionIndex()
+        self.watchlist_version += 1
+        self._loaded = False
+
+    def channels(self) -> list[tuple[int, int]]:
+        return list(self._channels.items())
+
+    def channel_for(self, guild_id: int) -> int | None:
+        return self._channels.get(guild_id)
+
+    def webhook_for(self, channel_id: int) -> tuple[int, str] | None:
+        return self._webhooks.get(channel_id)
+
+    def ping_roles(self) -> dict[int, int]:
+        return dict(self._ping_roles)
+
+    def ping_role_for(self, guild_id: int) -> int | None:
+        return self._ping_roles.get(guild_id)
+
+    def watchlist_for(self, guild_id: int) -> set[str]:
+        return self._watchlists.get(guild_id, set())
+
+    def all_watched_terms(self) -> set[str]:
+        return set().union(*self._watchlists.values())
+
+    def channels_for_listing(self, attributes: dict[str, set[str]],
+                             unfiltered_channels: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """(guild_id, channel_id) pairs that should receive a listing: every unfiltered channel
+        plus the filtered guilds the listing matches"""
+        matched = [
+            (guild_id, self._channels[guild_id])
+            for guild_id in self.subscriptions.match(attributes) if guild_id in self._channels
+        ]
+        return unfiltered_channels + matched if matched else unfiltered_channels
+
+    def unfiltered_channels(self) -> list[tuple[int, int]]:
+        return [(guild_id, channel_id) for guild_id, channel_id in self._channels.items()
+                if not self.subscriptions.has_filters(guild_id)]
+
+guild_config_cache = GuildConfigCache()
+
+async def bump_guild_config_version(session) -> str:
+    """Records a guild configuration change for other worker processes; call inside the writing session"""
+    version = str(time.time_ns())
+    await session.execute(
+        sqlite_insert(BotState)
+        .values(key=GUILD_CONFIG_VERSION_KEY, value=version)
+        .on_conflict_do_update(index_elements=[BotState.key], set_={'value': version})
+    )
+    return version
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await init_search_index(conn)
 
 async def set_guild_channel(guild_id: int, channel_id: int | None):
+    await guild_config_cache.ensure_loaded()
     async with async_session() as session:
         # Check if record exists
         result = await session.execute(
@@ -103,28 +732,42 @@ async def set_guild_channel(guild_id: int, channel_id: int | None):
             )
             session.add(guild_config)
         
+        version = await bump_guild_config_version(session)
         await session.commit()
+    guild_config_cache.set_channel(guild_id, channel_id)
+    guild_config_cache.mark_version(version)
 
-async def get_all_channels_from_db() -> list[tuple[int, int]]:
+async def get_all_channels() -> list[tuple[int, int]]:
     """Returns list of (guild_id, channel_id) tuples for all configured channels"""
-    async with async_session() as session:
-        result = await session.execute(
-            select(GuildConfig.guild_id, GuildConfig.channel_id)
-            .where(GuildConfig.channel_id.is_not(None))
-        )
-        return [(row.guild_id, row.channel_id) for row in result]
+    await guild_config_cache.ensure_loaded()
+    return guild_config_cache.channels()
 
 async def get_guild_channel(guild_id: int) -> int | None:
     """Get the configured channel for a specific guild"""
+    await guild_config_cache.ensure_loaded()
+    return guild_config_cache.channel_for(guild_id)
+
+async def set_channel_webhook(guild_id: int, channel_id: int, webhook: tuple[int, str] | None):
+    """Stores (webhook_id, webhook_token) as the delivery webhook of a channel, or forgets it for None"""
+    await guild_config_cache.ensure_loaded()
     async with async_session() as session:
-        result = await session.execute(
-            select(GuildConfig.channel_id)
-            .where(GuildConfig.guild_id == guild_id)
-        )
-        row = result.first()
-        return row.channel_id if row and row.channel_id else None
+        if webhook:
+            stmt = sqlite_insert(ChannelWebhook).values(
+                channel_id=channel_id, guild_id=guild_id, webhook_id=webhook[0], webhook_token=webhook[1]
+            )
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[ChannelWebhook.channel_id],
+                set_={'guild_id': guild_id, 'webhook_id': webhook[0], 'webhook_token': webhook[1]},
+            ))
+        else:
+            await session.execute(delete(ChannelWebhook).where(ChannelWebhook.channel_id == channel_id))
+        version = await bump_guild_config_version(session)
+        await session.commit()
+    guild_config_cache.set_webhook(channel_id, webhook)
+    guild_config_cache.mark_version(version)
 
 async def set_guild_ping_role(guild_id: int, role_id: int | None):
+    await guild_config_cache.ensure_loaded()
     async with async_session() as session:
         # Check if record exists
         result = await session.execute(
@@ -144,59 +787,419 @@ async def set_guild_ping_role(guild_id: int, role_id: int | None):
             )
             session.add(guild_config)
         
+        version = await bump_guild_config_version(session)
         await session.commit()
+    guild_config_cache.set_ping_role(guild_id, role_id)
+    guild_config_cache.mark_version(version)
 
 async def get_guild_ping_role(guild_id: int) -> int | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(GuildConfig.ping_role_id)
-            .where(GuildConfig.guild_id == guild_id)
-        )
-        row = result.first()
-        if row and row.ping_role_id:
-            try:
-                return int(row.ping_role_id)
-            except (ValueError, TypeError):
-                print(f"Warning: Invalid ping_role_id '{row.ping_role_id}' for guild {guild_id}. Treating as None.")
-                return None
-        return None
+    await guild_config_cache.ensure_loaded()
+    return guild_config_cache.ping_role_for(guild_id)
 
 async def get_all_guild_ping_roles() -> dict[int, int]:
     """Returns dict of {guild_id: ping_role_id} for all guilds with ping roles configured"""
+    await guild_config_cache.ensure_loaded()
+    return guild_config_cache.ping_roles()
+
+async def set_guild_watch(guild_id: int, company: str, watched: bool):
+    """Adds or removes a normalized company term from a guild's watchlist"""
+    await guild_config_cache.ensure_loaded()
     async with async_session() as session:
-        result = await session.execute(
-            select(GuildConfig.guild_id, GuildConfig.ping_role_id)
-            .where(GuildConfig.ping_role_id.is_not(None))
-        )
-        guild_roles = {}
-        for row in result:
-            try:
-                guild_roles[row.guild_id] = int(row.ping_role_id)
-            except (ValueError, TypeError):
-                print(f"Warning: Invalid ping_role_id '{row.ping_role_id}' for guild {row.guild_id}. Skipping.")
-        return guild_roles
+        if watched:
+            await session.execute(
+                sqlite_insert(GuildWatchlistEntry)
+                .values(guild_id=guild_id, company=company)
+                .on_conflict_do_nothing()
+            )
+        else:
+            await session.execute(
+                delete(GuildWatchlistEntry)
+                .where(GuildWatchlistEntry.guild_id == guild_id)
+                .where(GuildWatchlistEntry.company == company)
+            )
+        version = await bump_guild_config_version(session)
+        await session.commit()
+    guild_config_cache.set_watched(guild_id, company, watched)
+    guild_config_cache.mark_version(version)
+
+async def get_guild_watchlist(guild_id: int) -> list[str]:
+    await guild_config_cache.ensure_loaded()
+    return sorted(guild_config_cache.watchlist_for(guild_id))
+
+async def set_guild_filter(guild_id: int, field: str, value: str, enabled: bool):
+    """Adds or removes one accepted value of a guild's subscription filter"""
+    await guild_config_cache.ensure_loaded()
+    async with async_session() as session:
+        if enabled:
+            await session.execute(
+                sqlite_insert(GuildSubscriptionFilter)
+                .values(guild_id=guild_id, field=field, value=value)
+                .on_conflict_do_nothing()
+            )
+        else:
+            await session.execute(
+                delete(GuildSubscriptionFilter)
+                .where(GuildSubscriptionFilter.guild_id == guild_id)
+                .where(GuildSubscriptionFilter.field == field)
+                .where(GuildSubscriptionFilter.value == value)
+            )
+        version = await bump_guild_config_version(session)
+        await session.commit()
+    guild_config_cache.set_filter(guild_id, field, value, enabled)
+    guild_config_cache.mark_version(version)
+
+async def clear_guild_filters(guild_id: int):
+    await guild_config_cache.ensure_loaded()
+    async with async_session() as session:
+        await session.execute(delete(GuildSubscriptionFilter).where(GuildSubscriptionFilter.guild_id == guild_id))
+        version = await bump_guild_config_version(session)
+        await session.commit()
+    guild_config_cache.clear_filters(guild_id)
+    guild_config_cache.mark_version(version)
+
+async def get_guild_filters(guild_id: int) -> dict[str, list[str]]:
+    await guild_config_cache.ensure_loaded()
+    return {field: sorted(values) for field, values in guild_config_cache.subscriptions.filters_for(guild_id).items()}
+
+# --- Channel Health ---
+class ChannelHealthTracker:
+    """Process-wide copy of the channel_health rows. Failing channels are blocked with exponential backoff;
+    once a block expires, the next delivery probes the channel again and a success clears its row."""
+
+    def __init__(self):
+        self._health: dict[tuple[int, int], dict] = {}  # (guild_id, channel_id) -> channel_health row
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        """(Re)loads the rows; other worker processes record failures of their own shards"""
+        async with self._lock:
+            async with async_session() as session:
+                result = await session.execute(select(ChannelHealth))
+                self._health = {
+                    (row.guild_id, row.channel_id): {
+                        'guild_id': row.guild_id, 'channel_id': row.channel_id,
+                        'consecutive_failures': row.consecutive_failures, 'last_error': row.last_error,
+                        'first_failed_at': row.first_failed_at, 'blocked_until': row.blocked_until,
+                    }
+                    for row in result.scalars()
+                }
+            self._loaded = True
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    def is_blocked(self, guild_id: int, channel_id: int, now: float | None = None) -> bool:
+        health = self._health.get((guild_id, channel_id))
+        return health is not None and health['blocked_until'] > (now or time.time())
+
+    def is_gone(self, guild_id: int, channel_id: int, now: float | None = None) -> bool:
+        """Blocked for a failure that will not fix itself (CHANNEL_GONE_REASONS)"""
+        health = self._health.get((guild_id, channel_id))
+        return self.is_blocked(guild_id, channel_id, now) and health['last_error'] in CHANNEL_GONE_REASONS
+
+    def blocked_until(self, guild_id: int, channel_id: int) -> float:
+        health = self._health.get((guild_id, channel_id))
+        return health['blocked_until'] if health is not None else 0.0
+
+    def blocked_count(self) -> int:
+        now = time.time()
+        return sum(1 for health in self._health.values() if health['blocked_until'] > now)
+
+    @staticmethod
+    def _backoff(failures: int, gone: bool) -> float:
+        exponent = failures - 1 if gone else failures - MAX_RETRIES
+        return min(CHANNEL_BACKOFF_BASE_SECONDS * 2 ** max(exponent, 0), CHANNEL_BACKOFF_MAX_SECONDS)
+
+    async def record_failure(self, guild_id: int, channel_id: int, reason: str) -> float:
+        """Counts a failed delivery and returns how long the channel is now blocked for (0 if not blocked)"""
+        await self.ensure_loaded()
+        now = time.time()
+        health = self._health.get((guild_id, channel_id)) or {
+            'guild_id': guild_id, 'channel_id': channel_id, 'consecutive_failures': 0,
+            'first_failed_at': now, 'blocked_until': 0.0,
+        }
+        health['consecutive_failures'] += 1
+        health['last_error'] = reason
+        gone = reason in CHANNEL_GONE_REASONS
+        block_seconds = 0.0
+        if gone or health['consecutive_failures'] >= MAX_RETRIES:
+            block_seconds = self._backoff(health['consecutive_failures'], gone)
+            health['blocked_until'] = now + block_seconds
+        self._health[(guild_id, channel_id)] = health
+        async with async_session() as session:
+            stmt = sqlite_insert(ChannelHealth).values(**health)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[ChannelHealth.guild_id, ChannelHealth.channel_id],
+                set_={name: stmt.excluded[name] for name in ('consecutive_failures', 'last_error', 'blocked_until')},
+            ))
+            await session.commit()
+        return block_seconds
+
+    async def record_success(self, guild_id: int, channel_id: int):
+        await self.ensure_loaded()
+        if self._health.pop((guild_id, channel_id), None) is None:
+            return  # Healthy channels cost no database write
+        async with async_session() as session:
+            await session.execute(
+                delete(ChannelHealth)
+                .where(ChannelHealth.guild_id == guild_id)
+                .where(ChannelHealth.channel_id == channel_id)
+            )
+            await session.commit()
+
+    async def prune(self) -> int:
+        """Unconfigures channels that have been gone for CHANNEL_PRUNE_DAYS and forgets their health"""
+        await self.ensure_loaded()
+        cutoff = time.time() - CHANNEL_PRUNE_DAYS * 24 * 3600
+        gone = [
+            health for health in self._health.values()
+            if health['last_error'] in CHANNEL_GONE_REASONS and health['first_failed_at'] < cutoff
+        ]
+        for health in gone:
+            guild_id, channel_id = health['guild_id'], health['channel_id']
+            if await get_guild_channel(guild_id) == channel_id:
+                await set_guild_channel(guild_id, None)
+            await self.record_success(guild_id, channel_id)
+            print(f"Removed channel {channel_id} of guild {guild_id}: {health['last_error']} for over {CHANNEL_PRUNE_DAYS} days.")
+        return len(gone)
+
+channel_health = ChannelHealthTracker()
+
+# --- Listing Records ---
+# Fields of a feed listing that the diff, formatters, filters and search use; everything else is dropped at parse time
+LISTING_FIELDS = ('id', 'company_name', 'title', 'url', 'locations', 'season', 'terms', 'sponsorship',
+                  'date_posted', 'active', 'is_visible')
+
+def _intern(value):
+    """Interns strings, and the strings of lists (as tuples), that repeat across listings"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(sys.intern(item) if isinstance(item, str) else item for item in value)
+    return value
+
+class Listing:
+    """Compact, slotted listing record. Repeated strings (company, season, sponsorship, locations)
+    are interned, and the fingerprint of the full feed entry is computed once while parsing.
+    get() mirrors dict.get, so formatters accept a Listing or a plain role dict."""
+    __slots__ = LISTING_FIELDS + ('fingerprint',)
+
+    @classmethod
+    def from_role(cls, role: dict) -> 'Listing':
+        listing = cls()
+        listing.id = role.get('id')
+        listing.company_name = _intern(role.get('company_name'))
+        listing.title = role.get('title')
+        listing.url = role.get('url')
+        listing.locations = _intern(role.get('locations'))
+        listing.season = _intern(role.get('season'))
+        listing.terms = _intern(role.get('terms'))
+        listing.sponsorship = _intern(role.get('sponsorship'))
+        listing.date_posted = role.get('date_posted')
+        listing.active = _is_value_truthy(role.get('active', True))
+        listing.is_visible = _is_value_truthy(role.get('is_visible', True))
+        listing.fingerprint = listing_fingerprint(role)
+        return listing
+
+    def get(self, name: str, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self) -> dict:
+        """The stored form of the listing: its non-empty fields, with tuples as lists"""
+        result = {}
+        for name in LISTING_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = list(value) if isinstance(value, tuple) else value
+        return result
 
 # --- Repository and JSON Handling ---
-async def fetch_json_from_url(url: str) -> list:
-    """Fetch JSON data directly from URL"""
+def get_http_session() -> aiohttp.ClientSession:
+    """Returns the shared, connection-pooled HTTP session, creating it if needed"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS),
+        )
+    return http_session
+
+async def close_http_session():
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+        print("HTTP session closed.")
+    http_session = None
+
+class JSONArrayStreamParser:
+    """Incrementally decodes the items of a top-level JSON array from byte chunks,
+    so listings can be indexed while the payload is still arriving."""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'start'  # start -> first -> (item <-> after_item) -> done
+
+    def feed(self, chunk: bytes) -> list:
+        """Returns the array items completed by this chunk"""
+        self._buffer = self._buffer[self._pos:] + self._text_decoder.decode(chunk)
+        self._pos = 0
+        return self._drain(final=False)
+
+    def close(self) -> list:
+        """Returns any remaining items, raising JSONDecodeError if the array is incomplete"""
+        self._buffer = self._buffer[self._pos:] + self._text_decoder.decode(b'', final=True)
+        self._pos = 0
+        items = self._drain(final=True)
+        if self._state != 'done':
+            raise json.JSONDecodeError("Unterminated JSON array", self._buffer, self._pos)
+        return items
+
+    def _drain(self, final: bool) -> list:
+        items = []
+        buffer = self._buffer
+        while True:
+            while self._pos < len(buffer) and buffer[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos >= len(buffer):
+                return items
+
+            char = buffer[self._pos]
+            if self._state == 'start':
+                if char != '[':
+                    raise json.JSONDecodeError("Expecting '[' at start of listings", buffer, self._pos)
+                self._pos += 1
+                self._state = 'first'
+            elif self._state == 'done':
+                raise json.JSONDecodeError("Extra data after listings array", buffer, self._pos)
+            elif char == ']' and self._state in ('first', 'after_item'):
+                self._pos += 1
+                self._state = 'done'
+            elif char == ',' and self._state == 'after_item':
+                self._pos += 1
+                self._state = 'item'
+            elif self._state in ('first', 'item'):
+                try:
+                    item, end = self._decoder.raw_decode(buffer, self._pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    return items  # Item continues in the next chunk
+                if not final and not isinstance(item, (dict, list)):
+                    # A scalar such as 12 or 1.5 is only complete once its delimiter has arrived
+                    rest = buffer[end:].lstrip(' \t\n\r')
+                    if not rest or rest[0] not in ',]':
+                        return items
+                items.append(item)
+                self._pos = end
+                self._state = 'after_item'
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, self._pos)
+
+def index_roles(roles: list, roles_by_id: dict):
+    """Adds roles with an id to the id -> Listing index, skipping malformed entries"""
+    for role in roles:
+        if isinstance(role, dict) and role.get('id') is not None:
+            roles_by_id[role['id']] = Listing.from_role(role)
+
+def _parse_spooled_body(body_file) -> tuple[dict, float]:
+    """Pipeline stage: stream-parses a payload spooled to disk into an id -> Listing index.
+    Returns the index and the seconds spent parsing."""
+    started = time.perf_counter()
+    body_file.seek(0)
+    roles_by_id = read_roles_stream(body_file)
+    return roles_by_id, time.perf_counter() - started
+
+def mark_fetch_processed(url: str):
+    """Remember the validators of the last fetched response once its data has been processed.
+    Until then a failed cycle will re-download and re-process the same content."""
+    validators = pending_fetch_validators.pop(url, None)
+    if validators:
+        fetch_validators[url] = validators
+
+async def fetch_json_from_url(url: str, source_name: str | None = None) -> dict | None:
+    """Fetch and stream-parse listings from URL with a conditional request.
+    Returns an id -> Listing index, or None if the content is unchanged since the last processed fetch or the fetch failed."""
     print(f"Fetching JSON data from {url}...")
+    source_name = source_name or url
+    started = time.perf_counter()
+    outcome = "error"
+    validators = fetch_validators.get(url, {})
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    text_data = await response.text()
-                    data = json.loads(text_data)
-                    print(f"Successfully fetched {len(data)} items from {url}")
-                    return data
-                else:
-                    print(f"Error fetching {url}: HTTP {response.status}")
-                    return []
+        session = get_http_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                outcome = "not_modified"
+                print(f"No changes at {url} (HTTP 304).")
+                return None
+            if response.status != 200:
+                outcome = f"http_{response.status}"
+                print(f"Error fetching {url}: HTTP {response.status}")
+                return None
+
+            # The body is spooled to disk while hashing, so memory stays flat and unchanged payloads are never parsed
+            with tempfile.TemporaryFile() as body_file:
+                content_hash = hashlib.sha256()
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    content_hash.update(chunk)
+                    body_file.write(chunk)
+                    metrics.inc('fetch_bytes_total', len(chunk), source=source_name)
+
+                new_validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_hash': content_hash.hexdigest(),
+                }
+                if new_validators['content_hash'] == validators.get('content_hash'):
+                    # Same bytes under new validators (e.g. a CDN node without the ETag); keep the fresh ones
+                    fetch_validators[url] = new_validators
+                    outcome = "unchanged"
+                    print(f"No changes at {url} (content hash unchanged).")
+                    return None
+
+                roles_by_id, parse_seconds = await run_in_pipeline(_parse_spooled_body, body_file)
+                metrics.observe('parse_seconds', parse_seconds, source=source_name)
+
+            pending_fetch_validators[url] = new_validators
+            outcome = "changed"
+            metrics.set_gauge('listings', len(roles_by_id), source=source_name)
+            print(f"Successfully fetched {len(roles_by_id)} items from {url}")
+            return roles_by_id
     except json.JSONDecodeError as e:
+        outcome = "parse_error"
         print(f"Error parsing JSON from {url}: {e}")
-        return []
+        return None
     except Exception as e:
         print(f"Error fetching JSON from {url}: {e}")
-        return []
+        return None
+    finally:
+        metrics.observe('fetch_seconds', time.perf_counter() - started, source=source_name)
+        metrics.inc('fetches_total', source=source_name, outcome=outcome)
+
+def read_roles_stream(file) -> dict:
+    """Stream-parse a binary file object holding a listings JSON array into an id -> Listing index"""
+    parser = JSONArrayStreamParser()
+    roles_by_id = {}
+    while chunk := file.read(STREAM_CHUNK_SIZE):
+        index_roles(parser.feed(chunk), roles_by_id)
+    index_roles(parser.close(), roles_by_id)
+    return roles_by_id
+
+def read_roles_index(json_file_path: str) -> dict:
+    """Stream-parse a listings JSON file into an id -> Listing index"""
+    with open(json_file_path, 'rb') as file:
+        return read_roles_stream(file)
 
 def read_json(json_file_path):
     print(f"Reading JSON file from {json_file_path}...")
@@ -217,21 +1220,656 @@ def _is_value_truthy(value):
         return value.lower() == 'true'
     return bool(value)
 
+# --- Listing Snapshot Store ---
+def listing_fingerprint(role: dict) -> str:
+    """Stable content hash of a listing, independent of key order"""
+    canonical = json.dumps(role, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def _snapshot_row(source_name: str, role_id, role: Listing) -> dict:
+    return {
+        'source': source_name,
+        'listing_id': str(role_id),
+        'fingerprint': role.fingerprint,
+        'active': role.active,
+        'data': json.dumps(role.to_dict(), separators=(',', ':'), ensure_ascii=False),
+    }
+
+async def load_snapshot_index(source_name: str) -> dict[str, tuple[str, bool]]:
+    """Returns {listing_id: (fingerprint, active)} for a source, without loading listing data"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(ListingSnapshot.listing_id, ListingSnapshot.fingerprint, ListingSnapshot.active)
+            .where(ListingSnapshot.source == source_name)
+        )
+        return {row.listing_id: (row.fingerprint, row.active) for row in result}
+
+async def load_snapshot_roles(source_name: str, listing_ids) -> dict[str, dict]:
+    """Returns {listing_id: role} for the requested listings of a source"""
+    listing_ids = list(listing_ids)
+    roles = {}
+    async with async_session() as session:
+        for start in range(0, len(listing_ids), SNAPSHOT_QUERY_BATCH_SIZE):
+            result = await session.execute(
+                select(ListingSnapshot.listing_id, ListingSnapshot.data)
+                .where(ListingSnapshot.source == source_name)
+                .where(ListingSnapshot.listing_id.in_(listing_ids[start:start + SNAPSHOT_QUERY_BATCH_SIZE]))
+            )
+            for row in result:
+                roles[row.listing_id] = json.loads(row.data)
+    return roles
+
+async def save_snapshot_changes(source_name: str, changed_rows: list[dict], removed_ids, outbox_rows: list[dict] = (),
+                                announcement_rows: list[dict] = (), event_rows: list[dict] = ()) -> None:
+    """Upserts changed listings, deletes removed ones, updates their search documents, enqueues their
+    notifications, records their announcement keys and appends their history in a single transaction"""
+    removed_ids = list(removed_ids)
+    async with async_session() as session:
+        async with session.begin():
+            if event_rows:
+                await append_listing_events(session, event_rows)
+            if announcement_rows:
+                stmt = sqlite_insert(AnnouncementKey)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[AnnouncementKey.kind, AnnouncementKey.dedup_key],
+                    set_={
+                        'source': stmt.excluded.source,
+                        'listing_id': stmt.excluded.listing_id,
+                        'announced_at': stmt.excluded.announced_at,
+                    },
+                )
+                await session.execute(stmt, list(announcement_rows))
+            if outbox_rows:
+                await session.execute(
+                    sqlite_insert(OutboxMessage).on_conflict_do_nothing(index_elements=[OutboxMessage.idempotency_key]),
+                    list(outbox_rows),
+                )
+            changed_ids = [row['listing_id'] for row in changed_rows]
+            # Search documents share the snapshot rowid, so stale ones are dropped before the snapshot rows change
+            await delete_search_documents(session, source_name, changed_ids + removed_ids)
+            if changed_rows:
+                stmt = sqlite_insert(ListingSnapshot)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ListingSnapshot.source, ListingSnapshot.listing_id],
+                    set_={
+                        'fingerprint': stmt.excluded.fingerprint,
+                        'active': stmt.excluded.active,
+                        'data': stmt.excluded.data,
+                    },
+                )
+                await session.execute(stmt, changed_rows)
+            for start in range(0, len(removed_ids), SNAPSHOT_QUERY_BATCH_SIZE):
+                await session.execute(
+                    delete(ListingSnapshot)
+                    .where(ListingSnapshot.source == source_name)
+                    .where(ListingSnapshot.listing_id.in_(removed_ids[start:start + SNAPSHOT_QUERY_BATCH_SIZE]))
+                )
+            await insert_search_documents(session, source_name, changed_ids)
+
+# --- Listing Search ---
+# FTS5 index over the snapshot store. Each document's rowid is the rowid of its listing_snapshots row,
+# and documents are rewritten from the snapshot JSON inside the snapshot transaction.
+# listing_search_order holds each document's active flag and posting date under the same rowid, indexed,
+# so results are ranked by date without reading or sorting the full-text table.
+SEARCH_DOCUMENT_COLUMNS = """
+    rowid, source, listing_id,
+    coalesce(json_extract(data, '$.company_name'), ''),
+    coalesce(json_extract(data, '$.title'), ''),
+    coalesce(json_extract(data, '$.locations'), ''),
+    coalesce(json_extract(data, '$.season'), json_extract(data, '$.terms'), ''),
+    coalesce(json_extract(data, '$.url'), ''),
+    active,
+    coalesce(json_extract(data, '$.date_posted'), 0)
+"""
+SEARCH_INSERT_PREFIX = (
+    "INSERT INTO listing_search (rowid, source, listing_id, company, title, locations, season, url, active, date_posted) "
+    f"SELECT {SEARCH_DOCUMENT_COLUMNS} FROM listing_snapshots"
+)
+SEARCH_ORDER_INSERT_PREFIX = (
+    "INSERT INTO listing_search_order (rowid, active, date_posted) "
+    "SELECT rowid, active, CAST(coalesce(json_extract(data, '$.date_posted'), 0) AS INTEGER) FROM listing_snapshots"
+)
+SEARCH_INSERTS = [
+    text(f"{prefix} WHERE source = :source AND listing_id IN :ids").bindparams(bindparam('ids', expanding=True))
+    for prefix in (SEARCH_INSERT_PREFIX, SEARCH_ORDER_INSERT_PREFIX)
+]
+SEARCH_DELETES = [
+    text(
+        f"DELETE FROM {table} WHERE rowid IN "
+        "(SELECT rowid FROM listing_snapshots WHERE source = :source AND listing_id IN :ids)"
+    ).bindparams(bindparam('ids', expanding=True))
+    for table in ('listing_search', 'listing_search_order')
+]
+SEARCH_MATCH_PROBE = text("SELECT count(*) FROM (SELECT 1 FROM listing_search WHERE listing_search MATCH :query LIMIT :probe)")
+SEARCH_RESULT_COLUMNS = "source, listing_id, company, title, locations, season, url, active, date_posted"
+SEARCH_TERM_RE = re.compile(r'\w+')
+
+async def init_search_index(conn):
+    """Creates the FTS5 table and fills it from the snapshot store the first time"""
+    await conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS listing_search USING fts5("
+        "company, title, locations, season, source UNINDEXED, listing_id UNINDEXED, url UNINDEXED, "
+        "active UNINDEXED, date_posted UNINDEXED, prefix='2 3')"
+    )
+    await conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS listing_search_order "
+        "(rowid INTEGER PRIMARY KEY, active INTEGER NOT NULL, date_posted INTEGER NOT NULL)"
+    )
+    await conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_listing_search_order_active_date ON listing_search_order (active, date_posted)"
+    )
+    await conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_listing_search_order_date ON listing_search_order (date_posted)"
+    )
+    has_documents = (await conn.exec_driver_sql("SELECT 1 FROM listing_search LIMIT 1")).first()
+    if not has_documents:
+        result = await conn.exec_driver_sql(SEARCH_INSERT_PREFIX)
+        if result.rowcount:
+            print(f"Built the listing search index from {result.rowcount} snapshot rows.")
+    has_order = (await conn.exec_driver_sql("SELECT 1 FROM listing_search_order LIMIT 1")).first()
+    if not has_order:
+        await conn.exec_driver_sql(SEARCH_ORDER_INSERT_PREFIX)
+
+async def delete_search_documents(session, source_name: str, listing_ids: list[str]):
+    for start in range(0, len(listing_ids), SNAPSHOT_QUERY_BATCH_SIZE):
+        for statement in SEARCH_DELETES:
+            await session.execute(statement, {'source': source_name, 'ids': listing_ids[start:start + SNAPSHOT_QUERY_BATCH_SIZE]})
+
+async def insert_search_documents(session, source_name: str, listing_ids: list[str]):
+    for start in range(0, len(listing_ids), SNAPSHOT_QUERY_BATCH_SIZE):
+        for statement in SEARCH_INSERTS:
+            await session.execute(statement, {'source': source_name, 'ids': listing_ids[start:start + SNAPSHOT_QUERY_BATCH_SIZE]})
+
+def _fts_clause(columns: str, value: str | None) -> str | None:
+    """FTS5 query requiring every word of value as a prefix within the given column filter"""
+    terms = SEARCH_TERM_RE.findall(value.lower()) if value else []
+    if not terms:
+        return None
+    return f"{columns} : (" + ' AND '.join('"' + term + '"*' for term in terms) + ")"
+
+async def search_listings(company: str | None = None, keyword: str | None = None, location: str | None = None,
+                          season: str | None = None, active_only: bool = True, limit: int = SEARCH_RESULT_LIMIT) -> list[dict]:
+    """Newest listings matching every given filter; with no filters, simply the newest listings"""
+    clauses = [clause for clause in (
+        _fts_clause("company", company),
+        _fts_clause("{company title}", keyword),
+        _fts_clause("locations", location),
+        _fts_clause("season", season),
+    ) if clause]
+    conditions = []
+    params = {'limit': max(1, min(limit, SEARCH_MAX_RESULTS))}
+    if active_only:
+        conditions.append("listing_search_order.active = 1")
+    with metrics.timer('search_seconds'):
+        async with async_session() as session:
+            ranked = "listing_search_order"  # Read newest first through the date index
+            if clauses:
+                params['query'] = ' AND '.join(clauses)
+                matches = await session.scalar(SEARCH_MATCH_PROBE, {'query': params['query'], 'probe': SEARCH_INDEX_SCAN_MATCHES})
+                if matches >= SEARCH_INDEX_SCAN_MATCHES:
+                    # Common terms: walking the date index finds a page of matches long before the end
+                    conditions.append("listing_search_order.rowid IN (SELECT rowid FROM listing_search WHERE listing_search MATCH :query)")
+                else:
+                    # Rare terms: sorting the few matches beats walking the whole date index
+                    ranked = "listing_search CROSS JOIN listing_search_order ON listing_search_order.rowid = listing_search.rowid"
+                    conditions.append("listing_search MATCH :query")
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # Document columns are only read for the page; CROSS JOIN keeps SQLite from scanning the full-text table for it
+            result = await session.execute(
+                text(f"WITH page AS (SELECT listing_search_order.rowid AS id, listing_search_order.date_posted AS posted "
+                     f"FROM {ranked} {where} ORDER BY listing_search_order.date_posted DESC LIMIT :limit) "
+                     f"SELECT {SEARCH_RESULT_COLUMNS} FROM page CROSS JOIN listing_search ON listing_search.rowid = page.id "
+                     "ORDER BY page.posted DESC"),
+                params,
+            )
+            return [dict(row._mapping) for row in result]
+
+def format_search_results(rows: list[dict], heading: str) -> str:
+    lines = [heading]
+    for row in rows:
+        try:
+            locations = ', '.join(json.loads(row['locations'])) if row['locations'].startswith('[') else row['locations']
+        except (json.JSONDecodeError, TypeError):
+            locations = row['locations']
+        season = row['season']
+        if season.startswith('['):
+            season = ', '.join(json.loads(season))
+        posted = datetime.fromtimestamp(int(row['date_posted'])).strftime('%b %d') if int(row['date_posted'] or 0) else 'Unknown'
+        status = "" if int(row['active']) else " (inactive)"
+        lines.append(f"**{row['company']}** - [{row['title']}](<{row['url']}>){status}\n"
+                     f"{locations or 'Not specified'} · {season or 'Unknown'} · Posted {posted}")
+    return _truncate_message("\n".join(lines))
+
+def _legacy_snapshot_rows(source: ListingSource) -> list[dict]:
+    """Pipeline stage: reads a legacy JSON snapshot into snapshot rows"""
+    return [
+        _snapshot_row(source.name, role_id, role)
+        for role_id, role in read_roles_index(source.snapshot_file).items()
+    ]
+
+async def import_legacy_snapshot(source: ListingSource) -> dict[str, tuple[str, bool]]:
+    """Seeds the store from the source's legacy JSON snapshot so the first run does not re-announce everything"""
+    if not os.path.exists(source.snapshot_file):
+        print(f"No previous data found for {source.name}. Initializing.")
+        return {}
+    try:
+        rows = await run_in_pipeline(_legacy_snapshot_rows, source)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error reading or decoding previous data file {source.snapshot_file}: {e}. Starting fresh.")
+        return {}
+
+    await save_snapshot_changes(source.name, rows, [])
+    print(f"Imported {len(rows)} listings for {source.name} from {source.snapshot_file} into the snapshot store.")
+    return {row['listing_id']: (row['fingerprint'], row['active']) for row in rows}
+
+async def load_previous_snapshot(source: ListingSource) -> dict[str, tuple[str, bool]]:
+    old_index = await load_snapshot_index(source.name)
+    if old_index:
+        print(f"Previous snapshot loaded for {source.name}: {len(old_index)} listings.")
+        return old_index
+    return await import_legacy_snapshot(source)
+
+# --- Diff Engine ---
+EVENT_NEW = 'new'
+EVENT_DEACTIVATED = 'deactivated'
+EVENT_REACTIVATED = 'reactivated'
+EVENT_UPDATED = 'updated'
+
+# Fields whose edits are reported as EVENT_UPDATED; 'season' is the resolved season or terms string
+MATERIAL_FIELDS = ('title', 'locations', 'sponsorship', 'url', 'season')
+
+@dataclass
+class ListingEvent:
+    kind: str
+    listing_id: str
+    role: Listing
+    fingerprint: str = ''  # Fingerprint of the listing version that produced the event
+    changed_fields: tuple[str, ...] = ()  # Material fields that changed (EVENT_UPDATED only)
+    previous_values: dict = field(default_factory=dict)  # field -> old value for changed_fields
+
+@dataclass
+class ChangeSet:
+    """Result of diffing one source against its snapshot"""
+    source: ListingSource
+    events: list[ListingEvent] = field(default_factory=list)
+    changed_rows: list[dict] = field(default_factory=list)  # Snapshot rows to upsert
+    removed_ids: set[str] = field(default_factory=set)  # Listing ids no longer in the feed
+
+    def of_kind(self, kind: str) -> list[ListingEvent]:
+        return [event for event in self.events if event.kind == kind]
+
+    def counts(self) -> dict[str, int]:
+        counts = {}
+        for event in self.events:
+            counts[event.kind] = counts.get(event.kind, 0) + 1
+        return counts
+
+def _comparable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def material_value(role, name: str):
+    """Value of a material field as displayed; feeds keep the season in either 'season' or 'terms'"""
+    if name == 'season':
+        return get_term_emoji_and_string(role)[1]
+    return _comparable(role.get(name))
+
+def material_changes(old_role: dict, new_role: Listing) -> dict:
+    """Returns {field: old_value} for material fields that differ between two versions of a listing"""
+    changes = {}
+    for name in MATERIAL_FIELDS:
+        old_value = material_value(old_role, name)
+        if old_value != material_value(new_role, name):
+            changes[name] = old_value
+    return changes
+
+async def diff_listings(new_data: dict, old_index: dict, source: ListingSource) -> ChangeSet:
+    """Diffs the new id -> Listing index against the {listing_id: (fingerprint, active)} snapshot index.
+    Unchanged listings cost one fingerprint comparison; stored data is only loaded for edited listings.
+    The scan runs on the pipeline threads; the event loop only receives the change set."""
+    changes, edited = await run_in_pipeline(_diff_index, new_data, old_index, source)
+
+    if edited:
+        old_roles = await load_snapshot_roles(source.name, edited.keys())
+        for listing_id, (new_role, fingerprint) in edited.items():
+            previous_values = material_changes(old_roles.get(listing_id, {}), new_role)
+            if previous_values:
+                changes.events.append(ListingEvent(
+                    EVENT_UPDATED, listing_id, new_role, fingerprint,
+                    changed_fields=tuple(previous_values), previous_values=previous_values,
+                ))
+    return changes
+
+def _diff_index(new_data: dict, old_index: dict, source: ListingSource) -> tuple[ChangeSet, dict]:
+    """Pipeline stage of diff_listings. Returns the change set without EVENT_UPDATED events, and the
+    {listing_id: (new role, fingerprint)} of listings whose content changed without a status change."""
+    changes = ChangeSet(source=source)
+    edited = {}
+
+    for role_id, new_role in new_data.items():
+        listing_id = str(role_id)
+        fingerprint = new_role.fingerprint
+        old_entry = old_index.get(listing_id)
+        if old_entry and old_entry[0] == fingerprint:
+            continue  # Unchanged listing
+
+        changes.changed_rows.append(_snapshot_row(source.name, listing_id, new_role))
+        new_role_is_active = new_role.active
+        new_role_is_visible = new_role.is_visible
+
+        if old_entry is None:
+            if new_role_is_visible and new_role_is_active:
+                changes.events.append(ListingEvent(EVENT_NEW, listing_id, new_role, fingerprint))
+            continue
+
+        old_role_is_active = old_entry[1]
+        if old_role_is_active and not new_role_is_active:
+            changes.events.append(ListingEvent(EVENT_DEACTIVATED, listing_id, new_role, fingerprint))
+        elif source.track_reactivations and not old_role_is_active and new_role_is_active and new_role_is_visible:
+            changes.events.append(ListingEvent(EVENT_REACTIVATED, listing_id, new_role, fingerprint))
+        elif new_role_is_active and new_role_is_visible:
+            edited[listing_id] = (new_role, fingerprint)
+
+    changes.removed_ids = old_index.keys() - {str(role_id) for role_id in new_data}
+    return changes, edited
+
+# --- Listing History ---
+HISTORY_EVENT_KINDS = (EVENT_NEW, EVENT_DEACTIVATED, EVENT_REACTIVATED)
+STATS_DAILY = 'daily'
+STATS_PERIOD_DAY = 'day'
+STATS_PERIOD_WEEK = 'week'
+STATS_PERIOD_MONTH = 'month'
+STATS_PERIOD_LABELS = {STATS_PERIOD_DAY: 'today', STATS_PERIOD_WEEK: 'this week', STATS_PERIOD_MONTH: 'this month'}
+
+def period_buckets(moment: datetime) -> dict[str, str]:
+    """Rollup bucket of each period containing moment, in local time like the announcement dates"""
+    year, week, _ = moment.isocalendar()
+    return {
+        STATS_PERIOD_DAY: moment.strftime('%Y-%m-%d'),
+        STATS_PERIOD_WEEK: f"{year}-W{week:02d}",
+        STATS_PERIOD_MONTH: moment.strftime('%Y-%m'),
+    }
+
+def build_event_log_row(source_name: str, event: ListingEvent, now: float, duplicate: bool) -> dict:
+    _, season_str = get_term_emoji_and_string(event.role)
+    return {
+        'source': source_name,
+        'listing_id': event.listing_id,
+        'kind': event.kind,
+        'company': str(event.role.get('company_name') or '').strip(),
+        'season': None if season_str == "Unknown" else season_str,
+        'occurred_at': now,
+        'duplicate': duplicate,
+    }
+
+def rollup_increments(event_rows: list[dict]) -> list[dict]:
+    """Per-bucket count increments for a batch of event log rows; duplicates of other sources are not counted"""
+    counts = {}
+    for row in event_rows:
+        if row['duplicate']:
+            continue
+        values = [(ROLLUP_ALL, '')]
+        if row['company']:
+            values.append((ROLLUP_COMPANY, row['company']))
+        for season in (row['season'] or '').split(','):
+            if season.strip():
+                values.append((ROLLUP_SEASON, season.strip()))
+        for bucket in period_buckets(datetime.fromtimestamp(row['occurred_at'])).values():
+            for dimension, value in values:
+                key = (bucket, row['kind'], dimension, value)
+                counts[key] = counts.get(key, 0) + 1
+    return [
+        {'bucket': bucket, 'kind': kind, 'dimension': dimension, 'value': value, 'count': count}
+        for (bucket, kind, dimension, value), count in counts.items()
+    ]
+
+async def append_listing_events(session, event_rows: list[dict]):
+    """Appends events and increments their rollups; call inside the writing transaction"""
+    await session.execute(sqlite_insert(ListingEventLog), list(event_rows))
+    increments = rollup_increments(event_rows)
+    if increments:
+        stmt = sqlite_insert(ListingEventRollup)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ListingEventRollup.bucket, ListingEventRollup.kind,
+                                ListingEventRollup.dimension, ListingEventRollup.value],
+                set_={'count': ListingEventRollup.count + stmt.excluded['count']},
+            ),
+            increments,
+        )
+
+def stats_period_days(period: str, today: datetime) -> list[str]:
+    """Day buckets of the period containing today, up to today"""
+    if period == STATS_PERIOD_WEEK:
+        first = today.toordinal() - today.weekday()
+    elif period == STATS_PERIOD_MONTH:
+        first = today.toordinal() - today.day + 1
+    else:
+        first = today.toordinal()
+    return [datetime.fromordinal(ordinal).strftime('%Y-%m-%d') for ordinal in range(first, today.toordinal() + 1)]
+
+async def load_daily_rollups(days: list[str]) -> dict[str, dict[str, int]]:
+    """Returns {day: {kind: count}}; one primary key lookup per day and kind"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(ListingEventRollup.bucket, ListingEventRollup.kind, ListingEventRollup.count)
+            .where(ListingEventRollup.bucket.in_(days))
+            .where(ListingEventRollup.dimension == ROLLUP_ALL)
+        )
+        counts = {}
+        for row in result:
+            counts.setdefault(row.bucket, {})[row.kind] = row.count
+        return counts
+
+async def load_top_rollups(bucket: str, dimension: str, kind: str = EVENT_NEW, limit: int = STATS_TOP_LIMIT) -> list[tuple[str, int]]:
+    """Highest counts of a dimension in one bucket, read from the end of the rollup index"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(ListingEventRollup.value, ListingEventRollup.count)
+            .where(ListingEventRollup.bucket == bucket)
+            .where(ListingEventRollup.dimension == dimension)
+            .where(ListingEventRollup.kind == kind)
+            .order_by(ListingEventRollup.count.desc())
+            .limit(limit)
+        )
+        return [(row.value, row.count) for row in result]
+
+async def build_stats_message(report: str, period: str, now: float | None = None) -> str:
+    """Answers a /stats report from the rollups; the event log itself is never scanned"""
+    today = datetime.fromtimestamp(now or time.time())
+    label = STATS_PERIOD_LABELS[period]
+    with metrics.timer('stats_seconds'):
+        if report == STATS_DAILY:
+            days = stats_period_days(period, today)
+            counts = await load_daily_rollups(days)
+            if not counts:
+                return f"No listing activity recorded {label}."
+            lines = [f"Listing activity per day {label}:"]
+            for day in days:
+                day_counts = counts.get(day)
+                if not day_counts:
+                    continue
+                lines.append(f"`{datetime.strptime(day, '%Y-%m-%d').strftime('%b %d')}` {day_counts.get(EVENT_NEW, 0)} new, "
+                             f"{day_counts.get(EVENT_DEACTIVATED, 0)} closed, {day_counts.get(EVENT_REACTIVATED, 0)} reopened")
+            return _truncate_message("\n".join(lines))
+
+        rows = await load_top_rollups(period_buckets(today)[period], report)
+        if not rows:
+            return f"No new listings recorded {label}."
+        heading = "companies" if report == ROLLUP_COMPANY else "seasons"
+        lines = [f"Top {heading} by new listings {label}:"]
+        lines.extend(f"{rank}. **{value}** - {count}" for rank, (value, count) in enumerate(rows, start=1))
+        return _truncate_message("\n".join(lines))
+
+# --- Company Matching ---
+def normalize_company_term(term: str) -> str:
+    return ' '.join(term.lower().split())
+
+BIG_TECH_TERMS = frozenset(normalize_company_term(company) for company in BIG_TECH_COMPANIES)
+
+COMPANY_TOKEN_RE = re.compile(r'[a-z0-9]+|[^a-z0-9\s]')
+
+def _company_tokens(text: str) -> tuple[str, ...]:
+    """Words and single punctuation marks of a lowercased name, so "AT&T" is ('at', '&', 't')"""
+    return tuple(COMPANY_TOKEN_RE.findall(text.lower()))
+
+class CompanyMatcher:
+    """Set of company terms looked up by every token window of a name. A term only matches
+    as whole words ("hp" matches "HP Inc" but not "Chipotle"), and overlapping terms all match,
+    so "Amazon Web Services" matches both "amazon" and "amazon web services"."""
+
+    def __init__(self, terms):
+        self.terms = frozenset(normalize_company_term(term) for term in terms if term.strip())
+        self._by_tokens = {_company_tokens(term): term for term in self.terms}
+        self._max_tokens = max((len(tokens) for tokens in self._by_tokens), default=0)
+
+    def match(self, text: str) -> set[str]:
+        if not self._by_tokens or not text:
+            return set()
+        tokens = _company_tokens(text)
+        matched = set()
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(start + self._max_tokens, len(tokens)) + 1):
+                term = self._by_tokens.get(tokens[start:end])
+                if term is not None:
+                    matched.add(term)
+        return matched
+
+_company_matcher: CompanyMatcher | None = None
+_company_matcher_version = -1
+
+def get_company_matcher() -> CompanyMatcher:
+    """Returns the matcher over BIG_TECH_COMPANIES, every guild watchlist and every company filter,
+    rebuilt when one of them changes"""
+    global _company_matcher, _company_matcher_version
+    if _company_matcher is None or _company_matcher_version != guild_config_cache.watchlist_version:
+        _company_matcher = CompanyMatcher(
+            BIG_TECH_TERMS | guild_config_cache.all_watched_terms()
+            | guild_config_cache.subscriptions.values_for_field(FILTER_COMPANY)
+        )
+        _company_matcher_version = guild_config_cache.watchlist_version
+    return _company_matcher
+
+def match_companies(role) -> set[str]:
+    """Company terms matched by a role's company name, computed once per role"""
+    return get_company_matcher().match(str(role.get('company_name', '')))
+
+def is_watched_company(guild_id: int, matched_companies: set[str]) -> bool:
+    """True if a role's matched companies include a big tech company or one on the guild's watchlist"""
+    if not matched_companies:
+        return False
+    return not matched_companies.isdisjoint(BIG_TECH_TERMS) or not matched_companies.isdisjoint(guild_config_cache.watchlist_for(guild_id))
+
+# --- Subscription Filters ---
+TITLE_WORD_RE = re.compile(r'[a-z0-9+#]+')
+
+def _term_values(text: str) -> set[str]:
+    """A normalized term plus each of its words, so both "summer" and "summer 2026" match Summer 2026"""
+    term = normalize_filter_value(text)
+    return {term, *term.split()} if term else set()
+
+def listing_attributes(role, matched_companies: set[str] | None = None) -> dict[str, set[str]]:
+    """Filterable attribute values of a listing, normalized like the values guilds subscribe with"""
+    _, season_str = get_term_emoji_and_string(role)
+    seasons = set()
+    if season_str != "Unknown":
+        for term in season_str.split(','):
+            seasons |= _term_values(term)
+
+    locations = set()
+    for location in role.get('locations') or []:
+        location = str(location)
+        locations.add(normalize_filter_value(location))
+        for part in location.split(','):
+            locations |= _term_values(part)
+
+    if matched_companies is None:
+        matched_companies = match_companies(role)
+    companies = set(matched_companies)
+    companies.add(normalize_company_term(str(role.get('company_name', ''))))
+
+    words = TITLE_WORD_RE.findall(str(role.get('title', '')).lower())
+    keywords = set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+    return {
+        FILTER_SEASON: seasons,
+        FILTER_LOCATION: locations,
+        FILTER_SPONSORSHIP: {normalize_filter_value(str(role.get('sponsorship') or ''))},
+        FILTER_COMPANY: companies,
+        FILTER_KEYWORD: keywords,
+    }
+
+# --- Cross-Source Deduplication ---
+announcement_lock = asyncio.Lock()  # Serializes dedup lookups and commits of concurrently processed sources
+
+def normalize_listing_url(url) -> str | None:
+    """Lowercased host without "www.", path without trailing slash, query without tracking parameters"""
+    if not isinstance(url, str) or not url.strip() or url == '#':
+        return None
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    host = parts.netloc.lower().removeprefix('www.')
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in DEDUP_TRACKING_PARAMS
+    ))
+    return f"{host}{parts.path.rstrip('/')}?{query}" if query else f"{host}{parts.path.rstrip('/')}"
+
+DEDUP_SEASON_NAMES = {'spring': 'spring', 'summer': 'summer', 'fall': 'fall', 'autumn': 'fall', 'winter': 'winter'}
+
+def dedup_keys(role) -> list[str]:
+    """Keys under which the same posting is recognized across sources"""
+    keys = []
+    url = normalize_listing_url(role.get('url'))
+    if url:
+        keys.append(f"url:{url}")
+    company = normalize_company_term(str(role.get('company_name') or ''))
+    title = ' '.join(TITLE_WORD_RE.findall(str(role.get('title') or '').lower()))
+    if company and title:
+        # Feeds spell terms differently ("Fall" vs "Fall 2025"), but a company's same-titled roles differ by season
+        _, season_str = get_term_emoji_and_string(role)
+        seasons = ','.join(sorted({DEDUP_SEASON_NAMES[word] for word in season_str.lower().split() if word in DEDUP_SEASON_NAMES}))
+        keys.append(f"title:{company}|{title}|{seasons}")
+    return keys
+
+async def load_recent_announcements(keys, now: float) -> dict[tuple[str, str], tuple[str, str]]:
+    """Returns {(kind, dedup_key): (source, listing_id)} for keys announced within DEDUP_WINDOW_SECONDS"""
+    keys = list(keys)
+    announced = {}
+    async with async_session() as session:
+        for start in range(0, len(keys), SNAPSHOT_QUERY_BATCH_SIZE):
+            result = await session.execute(
+                select(AnnouncementKey.kind, AnnouncementKey.dedup_key, AnnouncementKey.source, AnnouncementKey.listing_id)
+                .where(AnnouncementKey.dedup_key.in_(keys[start:start + SNAPSHOT_QUERY_BATCH_SIZE]))
+                .where(AnnouncementKey.announced_at >= now - DEDUP_WINDOW_SECONDS)
+            )
+            for row in result:
+                announced[(row.kind, row.dedup_key)] = (row.source, row.listing_id)
+    return announced
+
+async def prune_announcement_keys():
+    """Deletes announcement keys that no longer suppress anything"""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                delete(AnnouncementKey).where(AnnouncementKey.announced_at < time.time() - DEDUP_WINDOW_SECONDS)
+            )
+
 # --- Message Formatting ---
 def get_term_emoji_and_string(role_data):
     raw_terms = role_data.get('terms')
     raw_season = role_data.get('season')
     season_str = "Unknown" # Default
-    collected_emojis = []
 
     # Prioritize 'season' if available, then 'terms'
     if raw_season:
-        if isinstance(raw_season, list) and raw_season:
+        if isinstance(raw_season, (list, tuple)) and raw_season:
             season_str = ', '.join(raw_season)
         elif isinstance(raw_season, str) and raw_season.strip():
             season_str = raw_season
     elif raw_terms:
-        if isinstance(raw_terms, list) and raw_terms:
+        if isinstance(raw_terms, (list, tuple)) and raw_terms:
             season_str = ', '.join(raw_terms)
         elif isinstance(raw_terms, str) and raw_terms.strip():
             season_str = raw_terms
@@ -239,7 +1877,15 @@ def get_term_emoji_and_string(role_data):
     if not season_str or season_str == "Unknown": # If no valid season/term found
          return EMOJI_UNKNOWN_TERM, "Unknown"
 
+    # Return the processed season string (could be "Unknown", "Summer 2025", "Fall 2025, Winter 2025", etc.)
+    # and the collected/defaulted emoji string.
+    return _term_emoji(season_str), season_str
+
+@lru_cache(maxsize=256)
+def _term_emoji(season_str: str) -> str:
+    """Emoji for a season string; feeds only use a handful of distinct seasons, so this is memoized"""
     season_lower = season_str.lower()
+    collected_emojis = []
 
     if "summer" in season_lower or "spring" in season_lower:
         collected_emojis.append(EMOJI_SUMMER)
@@ -249,16 +1895,29 @@ def get_term_emoji_and_string(role_data):
         collected_emojis.append(EMOJI_FALL)
     
     if not collected_emojis: # If no specific terms found, but season_str has a value
-        final_emoji_str = EMOJI_UNKNOWN_TERM
-    else:
-        final_emoji_str = "".join(collected_emojis) # Join emojis like "❄️🍂"
-
-    # Return the processed season string (could be "Unknown", "Summer 2025", "Fall 2025, Winter 2025", etc.)
-    # and the collected/defaulted emoji string.
-    return final_emoji_str, season_str
-
-
-def format_message(role, guild_id: int, guild_ping_roles: dict[int, int]):
+        return EMOJI_UNKNOWN_TERM
+    return "".join(collected_emojis) # Join emojis like "❄️🍂"
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    """A message rendered once per role; guilds differ only in the optional ping between head and tail"""
+    head: str
+    tail: str = ""
+    pingable: bool = False  # Whether any guild may be pinged for this message
+    always_ping: bool = False  # Ping every guild with a ping role, regardless of company
+    matched_companies: frozenset = frozenset()
+
+    def for_guild(self, guild_id: int, guild_ping_roles: dict[int, int]) -> str:
+        if self.pingable:
+            ping_role_id = guild_ping_roles.get(guild_id)
+            if ping_role_id and (self.always_ping or is_watched_company(guild_id, self.matched_companies)):
+                return f"{self.head}<@&{ping_role_id}> {self.tail}"
+        return self.head + self.tail
+
+def _display_date(display_date: str | None) -> str:
+    return display_date or datetime.now().strftime('%b %d')
+
+def render_new_role(role, matched_companies: set[str] | None = None, display_date: str | None = None) -> RenderedMessage:
     company_name_str = role.get('company_name', 'N/A Company')
     title_str = role.get('title', 'N/A Title')
     url_str = role.get('url', '#')
@@ -267,276 +1926,824 @@ def format_message(role, guild_id: int, guild_ping_roles: dict[int, int]):
     term_emoji, term_str = get_term_emoji_and_string(role)
 
     if term_str == "Unknown" and url_str != '#': # Special formatting for unknown term but existing URL
-        return (f"{EMOJI_NEW} **{company_name_str}** - {title_str}\n"
-                f"Term: {term_emoji} {term_str}. Review details: <{url_str}>")
+        return RenderedMessage(f"{EMOJI_NEW} **{company_name_str}** - {title_str}\n"
+                               f"Term: {term_emoji} {term_str}. Review details: <{url_str}>")
     elif term_str == "Unknown": # Fallback if URL is also not present for an unknown term
-        return (f"{EMOJI_NEW} **{company_name_str}** - {title_str}\n"
-                f"Term: {term_emoji} {term_str}. More details unavailable.")
-
-    ping_str = ""
-    ping_role_id = guild_ping_roles.get(guild_id)
-    if ping_role_id:
-        should_ping = False
-        # Example: Ping for specific terms like "Winter 2026"
-        # You might want to make this list/logic configurable or more dynamic
-        if any(company.lower() in company_name_str.lower() for company in BIG_TECH_COMPANIES):
-            should_ping = True
-        
-        if should_ping:
-            ping_str = f"<@&{ping_role_id}> "
-
-    return (f"{EMOJI_NEW} **{company_name_str}** just posted a new internship! {ping_str}\n"
-            f"[{title_str}]({url_str})\n"
-            f"**Location(s):** {location_str}\n"
-            f"**Term:** {term_emoji} {term_str}\n"
-            f"**Sponsorship:** `{sponsorship_str}`\n"
-            f"**Posted:** {datetime.now().strftime('%b %d')}")
-
-def format_deactivation_message(role):
+        return RenderedMessage(f"{EMOJI_NEW} **{company_name_str}** - {title_str}\n"
+                               f"Term: {term_emoji} {term_str}. More details unavailable.")
+
+    if matched_companies is None:
+        matched_companies = match_companies(role)
+    return RenderedMessage(
+        head=f"{EMOJI_NEW} **{company_name_str}** just posted a new internship! ",
+        tail=(f"\n"
+              f"[{title_str}]({url_str})\n"
+              f"**Location(s):** {location_str}\n"
+              f"**Term:** {term_emoji} {term_str}\n"
+              f"**Sponsorship:** `{sponsorship_str}`\n"
+              f"**Posted:** {_display_date(display_date)}"),
+        pingable=True,
+        matched_companies=frozenset(matched_companies),
+    )
+
+def render_deactivation(role, display_date: str | None = None) -> RenderedMessage:
     company_name_str = role.get('company_name', 'N/A Company')
     title_str = role.get('title', 'N/A Title')
     url_str = role.get('url', '#') # Keep URL for reference
     term_emoji, term_str = get_term_emoji_and_string(role)
 
-    return (f"{EMOJI_DEACTIVATED} **{company_name_str}** internship is no longer active.\n"
-            f"[{title_str}]({url_str}) - Term: {term_emoji} {term_str}\n"
-            f"Deactivated: {datetime.now().strftime('%b %d')}")
+    return RenderedMessage(f"{EMOJI_DEACTIVATED} **{company_name_str}** internship is no longer active.\n"
+                           f"[{title_str}]({url_str}) - Term: {term_emoji} {term_str}\n"
+                           f"Deactivated: {_display_date(display_date)}")
 
-def format_reactivation_message(role, guild_id: int, guild_ping_roles: dict[int, int]):
+def render_reactivation(role, matched_companies: set[str] | None = None, display_date: str | None = None) -> RenderedMessage:
     company_name_str = role.get('company_name', 'N/A Company')
     title_str = role.get('title', 'N/A Title')
     url_str = role.get('url', '#')
     term_emoji, term_str = get_term_emoji_and_string(role)
 
-    ping_str = ""
-    ping_role_id = guild_ping_roles.get(guild_id)
-    if ping_role_id:
-        should_ping = False
-        if "winter 2026" in term_str.lower(): # Consistent ping logic
-             should_ping = True
-        if any(company.lower() in company_name_str.lower() for company in BIG_TECH_COMPANIES):
-            should_ping = True
-        if should_ping:
-            ping_str = f"<@&{ping_role_id}> "
+    if matched_companies is None:
+        matched_companies = match_companies(role)
+    return RenderedMessage(
+        head=f"{EMOJI_REACTIVATED} ",
+        tail=(f"**{company_name_str}** internship is active again!\n"
+              f"[{title_str}]({url_str}) - Term: {term_emoji} {term_str}\n"
+              f"Reactivated: {_display_date(display_date)}"),
+        pingable=True,
+        always_ping="winter 2026" in term_str.lower(), # Consistent ping logic
+        matched_companies=frozenset(matched_companies),
+    )
+
+def _format_field_value(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value) if value else 'Not specified'
+    return str(value) if value not in (None, '') else 'Not specified'
+
+def render_update(role, changed_fields: tuple[str, ...], previous_values: dict) -> RenderedMessage:
+    company_name_str = role.get('company_name', 'N/A Company')
+    title_str = role.get('title', 'N/A Title')
+    url_str = role.get('url', '#')
 
-    return (f"{EMOJI_REACTIVATED} {ping_str}**{company_name_str}** internship is active again!\n"
-            f"[{title_str}]({url_str}) - Term: {term_emoji} {term_str}\n"
-            f"Reactivated: {datetime.now().strftime('%b %d')}")
+    change_lines = [
+        f"**{name.capitalize()}:** {_format_field_value(previous_values.get(name))} → {_format_field_value(material_value(role, name))}"
+        for name in changed_fields
+    ]
+    return RenderedMessage(f"{EMOJI_UPDATED} **{company_name_str}** updated an internship posting.\n"
+                           f"[{title_str}]({url_str})\n"
+                           + "\n".join(change_lines))
+
+def render_event(event: ListingEvent, display_date: str | None = None) -> RenderedMessage:
+    """Renders the guild-independent part of an event's message once"""
+    if event.kind == EVENT_NEW:
+        return render_new_role(event.role, match_companies(event.role), display_date)
+    if event.kind == EVENT_DEACTIVATED:
+        return render_deactivation(event.role, display_date)
+    if event.kind == EVENT_REACTIVATED:
+        return render_reactivation(event.role, match_companies(event.role), display_date)
+    return render_update(event.role, event.changed_fields, event.previous_values)
+
+def format_message(role, guild_id: int, guild_ping_roles: dict[int, int], matched_companies: set[str] | None = None):
+    return render_new_role(role, matched_companies).for_guild(guild_id, guild_ping_roles)
 
+def format_deactivation_message(role):
+    return render_deactivation(role).for_guild(0, {})
+
+def format_reactivation_message(role, guild_id: int, guild_ping_roles: dict[int, int], matched_companies: set[str] | None = None):
+    return render_reactivation(role, matched_companies).for_guild(guild_id, guild_ping_roles)
+
+def format_update_message(role, changed_fields: tuple[str, ...], previous_values: dict):
+    return render_update(role, changed_fields, previous_values).for_guild(0, {})
 
-# --- Discord Interaction ---
-async def send_discord_message(message_content: str, guild_id: int, channel_id: int):
-    global failed_channels, channel_failure_counts # Ensure we're modifying the global sets/dicts
-    
-    # Use a composite key for failed channels since we now track by guild+channel
-    channel_key = f"{guild_id}:{channel_id}"
-    
-    if channel_key in failed_channels:
-        print(f"Skipping previously failed channel ID {channel_id} in guild {guild_id}")
-        return
 
+# --- Discord Interaction ---
+async def send_discord_message(message_content: str, guild_id: int, channel_id: int) -> bool:
+    """Sends one message, returning True on success. Raises discord.RateLimited so the caller can retry."""
+    await channel_health.ensure_loaded()
+    if channel_health.is_blocked(guild_id, channel_id):
+        print(f"Skipping blocked channel ID {channel_id} in guild {guild_id}")
+        return False
+
+    failure = None
     try:
-        channel = client.get_channel(channel_id)
+        channel = client.get_channel(channel_id) or fetched_channels.get(channel_id)
         if channel is None:
             print(f"Channel {channel_id} not in cache, attempting to fetch...")
             channel = await client.fetch_channel(channel_id)
+            fetched_channels[channel_id] = channel
 
         if not isinstance(channel, discord.TextChannel): # Check if it's a text channel
             print(f"Error: Channel ID {channel_id} is not a text channel. Skipping.")
-            # Optionally, add to failed_channels if this is a persistent issue type
-            channel_failure_counts[channel_key] = channel_failure_counts.get(channel_key, 0) + MAX_RETRIES # Mark as failed
-            failed_channels.add(channel_key)
-            return
-
-        await channel.send(message_content)
-        print(f"Successfully sent message to channel {channel_id} in guild {guild_id}")
-        if channel_key in channel_failure_counts: # Reset on success
-            del channel_failure_counts[channel_key]
-        if channel_key in failed_channels: # Also remove from perm failed if successful now
-             failed_channels.remove(channel_key)
-        await asyncio.sleep(1)  # Rate limiting
+            failure = 'not_text_channel'
+        else:
+            await channel.send(message_content)
+            print(f"Successfully sent message to channel {channel_id} in guild {guild_id}")
+            await channel_health.record_success(guild_id, channel_id)
+            return True
 
     except discord.NotFound:
         print(f"Channel {channel_id} not found in guild {guild_id}.")
-        channel_failure_counts[channel_key] = channel_failure_counts.get(channel_key, 0) + 1
+        fetched_channels.pop(channel_id, None)
+        failure = 'not_found'
     except discord.Forbidden:
         print(f"No permission for channel {channel_id} in guild {guild_id}.")
-        failed_channels.add(channel_key) # Add to permanent failures for permission issues
+        fetched_channels.pop(channel_id, None)
+        failure = 'forbidden'
+    except discord.RateLimited:
+        raise # Retried by the delivery dispatcher after retry_after
+    except discord.HTTPException as e:
+        if e.status == 429:
+            raise discord.RateLimited(_retry_after_from(e)) from e
+        print(f"Error sending message to channel {channel_id} in guild {guild_id}: {e}")
+        failure = 'http_error'
     except Exception as e:
         print(f"Error sending message to channel {channel_id} in guild {guild_id}: {e}")
-        channel_failure_counts[channel_key] = channel_failure_counts.get(channel_key, 0) + 1
-    finally:
-        # Add to failed_channels if retries exceeded
-        if channel_failure_counts.get(channel_key, 0) >= MAX_RETRIES:
-            print(f"Channel {channel_id} in guild {guild_id} has failed {MAX_RETRIES} times, adding to failed channels for this session.")
-            failed_channels.add(channel_key)
-
-
-async def send_messages_to_all_configured_channels(message_content: str, guild_ping_roles: dict[int, int] = None):
-    channel_configs = await get_all_channels_from_db()
-    if not channel_configs:
-        print("No channels configured in the database to send messages to.")
+        failure = 'error'
+
+    metrics.inc('channel_failures_total', reason=failure)
+    block_seconds = await channel_health.record_failure(guild_id, channel_id, failure)
+    if block_seconds:
+        print(f"Channel {channel_id} in guild {guild_id} is blocked for {block_seconds:.0f}s ({failure}).")
+    return False
+
+async def ensure_channel_webhook(channel: discord.TextChannel) -> tuple[int, str]:
+    """Returns (webhook_id, webhook_token) of the bot's webhook in channel, creating it if needed.
+    Raises discord.Forbidden without the Manage Webhooks permission."""
+    for webhook in await channel.webhooks():
+        # Only webhooks the bot created itself expose their token
+        if webhook.token and webhook.user is not None and webhook.user.id == client.user.id:
+            return webhook.id, webhook.token
+    webhook = await channel.create_webhook(name=WEBHOOK_NAME, reason="Internship notification delivery")
+    return webhook.id, webhook.token
+
+webhook_buckets: dict[int, 'TokenBucket'] = {}  # webhook_id -> per-webhook rate bucket
+
+async def _send_webhook_fallback(message_content: str, guild_id: int, channel_id: int) -> bool:
+    """Sends as the bot for a channel without a webhook, within the bot token's global rate limit"""
+    await bot_fallback_bucket.acquire()
+    return await send_discord_message(message_content, guild_id, channel_id)
+
+async def send_webhook_message(message_content: str, guild_id: int, channel_id: int) -> bool:
+    """Sends one message through the channel's webhook over the shared HTTP session, returning True on success.
+    Channels without a webhook use send_discord_message. Raises discord.RateLimited so the caller can retry."""
+    await guild_config_cache.ensure_loaded()
+    webhook = guild_config_cache.webhook_for(channel_id)
+    if webhook is None:
+        return await _send_webhook_fallback(message_content, guild_id, channel_id)
+    await channel_health.ensure_loaded()
+    if channel_health.is_blocked(guild_id, channel_id):
+        print(f"Skipping blocked channel ID {channel_id} in guild {guild_id}")
+        return False
+
+    webhook_id, webhook_token = webhook
+    bucket = webhook_buckets.get(webhook_id)
+    if bucket is None:
+        bucket = webhook_buckets[webhook_id] = TokenBucket(WEBHOOK_SEND_RATE, WEBHOOK_SEND_BURST)
+    await bucket.acquire()
+
+    failure = None
+    webhook_gone = False
+    try:
+        async with get_http_session().post(
+            f"{WEBHOOK_API_BASE}/webhooks/{webhook_id}/{webhook_token}", json={'content': message_content}
+        ) as response:
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                bucket.pause(_header_seconds(response.headers, 'X-RateLimit-Reset-After'))
+            if response.status == 429:
+                raise discord.RateLimited(_header_seconds(response.headers, 'Retry-After'))
+            if response.status < 300:
+                print(f"Successfully sent webhook message to channel {channel_id} in guild {guild_id}")
+                await channel_health.record_success(guild_id, channel_id)
+                return True
+            webhook_gone = response.status in (401, 404)
+            if not webhook_gone:
+                print(f"Error sending webhook message to channel {channel_id} in guild {guild_id}: HTTP {response.status}")
+                failure = 'forbidden' if response.status == 403 else 'http_error'
+    except discord.RateLimited:
+        raise # Retried by the delivery dispatcher after retry_after
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error sending webhook message to channel {channel_id} in guild {guild_id}: {e}")
+        failure = 'error'
+
+    if webhook_gone:
+        # The webhook was deleted in Discord; forget it and deliver as the bot until /set_channel recreates it
+        print(f"Webhook {webhook_id} of channel {channel_id} in guild {guild_id} is gone, falling back to the bot.")
+        webhook_buckets.pop(webhook_id, None)
+        await set_channel_webhook(guild_id, channel_id, None)
+        return await _send_webhook_fallback(message_content, guild_id, channel_id)
+
+    metrics.inc('channel_failures_total', reason=failure)
+    block_seconds = await channel_health.record_failure(guild_id, channel_id, failure)
+    if block_seconds:
+        print(f"Channel {channel_id} in guild {guild_id} is blocked for {block_seconds:.0f}s ({failure}).")
+    return False
+
+def _is_local_guild(guild_id: int) -> bool:
+    return not SHARD_COUNT or SHARD_IDS is None or shard_for_guild(guild_id) in SHARD_IDS
+
+async def warm_channel_cache():
+    """Resolves every configured channel missing from the gateway cache concurrently, before the first
+    delivery, so the first cycle does not fetch them one by one. Dead channels are recorded in channel_health."""
+    await channel_health.ensure_loaded()
+    missing = [
+        (guild_id, channel_id) for guild_id, channel_id in await get_all_channels()
+        if _is_local_guild(guild_id) and client.get_channel(channel_id) is None
+        and channel_id not in fetched_channels and not channel_health.is_blocked(guild_id, channel_id)
+        and not (WEBHOOK_DELIVERY and guild_config_cache.webhook_for(channel_id))
+    ]
+    if not missing:
         return
+    semaphore = asyncio.Semaphore(CHANNEL_WARMUP_CONCURRENCY)
 
-    if guild_ping_roles is None:
-        guild_ping_roles = await get_all_guild_ping_roles()
+    async def resolve(guild_id: int, channel_id: int):
+        async with semaphore:
+            try:
+                fetched_channels[channel_id] = await client.fetch_channel(channel_id)
+            except discord.NotFound:
+                await channel_health.record_failure(guild_id, channel_id, 'not_found')
+            except discord.Forbidden:
+                await channel_health.record_failure(guild_id, channel_id, 'forbidden')
+            except Exception as e:
+                print(f"Could not resolve channel {channel_id} in guild {guild_id}: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(resolve(guild_id, channel_id) for guild_id, channel_id in missing))
+    print(f"Resolved {len(missing)} uncached channels in {time.perf_counter() - started:.2f}s.")
+
+def _header_seconds(headers, name: str, default: float = 1.0) -> float:
+    try:
+        return float(headers.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def _retry_after_from(error: discord.HTTPException) -> float:
+    """Reads the retry delay of a 429 response, defaulting to one second"""
+    return _header_seconds(getattr(error.response, 'headers', None) or {}, 'Retry-After')
+
+class TokenBucket:
+    """Async token bucket limiting a message rate (globally, or per webhook)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Withholds the next token for seconds, e.g. when the server reports the bucket exhausted"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate, 1 - seconds * self.rate)
+        self._updated = now
+
+class DeliveryDispatcher:
+    """Bounded outbound queue: one FIFO queue and worker per channel, a global token bucket,
+    and retries after Discord's retry_after on 429s. enqueue() waits when queues are full."""
+
+    def __init__(self, send_func, rate: float = GLOBAL_SEND_RATE, burst: float = GLOBAL_SEND_BURST,
+                 channel_queue_size: int = CHANNEL_QUEUE_SIZE, max_pending: int = MAX_PENDING_DELIVERIES):
+        self._send_func = send_func  # async (message_content, guild_id, channel_id) -> bool
+        self._bucket = TokenBucket(rate, burst)
+        self._channel_queue_size = channel_queue_size
+        self._pending = asyncio.Semaphore(max_pending)
+        self._queues: dict[int, asyncio.Queue] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self.pending_count = 0
+
+    async def enqueue(self, guild_id: int, channel_id: int, message_content: str, on_done=None):
+        """Queues a message; on_done(delivered: bool) is awaited once it has been sent or given up"""
+        await self._pending.acquire()
+        self.pending_count += 1
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue(maxsize=self._channel_queue_size)
+        await queue.put((guild_id, message_content, on_done))
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._channel_worker(channel_id, queue))
+
+    async def join(self):
+        """Waits until every queued message has been delivered or dropped"""
+        while self._queues:
+            await asyncio.gather(*(queue.join() for queue in list(self._queues.values())))
+            if self.pending_count == 0:
+                return
 
-    # Filter out failed channels
-    active_channel_configs = [
-        (guild_id, channel_id) for guild_id, channel_id in channel_configs 
-        if f"{guild_id}:{channel_id}" not in failed_channels
-    ]
-    
-    tasks = [send_discord_message(message_content, guild_id, channel_id) for guild_id, channel_id in active_channel_configs]
-    if tasks:
-        await asyncio.gather(*tasks)
+    def queue_depths(self) -> dict[int, int]:
+        return {channel_id: queue.qsize() for channel_id, queue in self._queues.items()}
 
-# --- Scheduled Tasks ---
-async def combined_scheduled_task():
-    """Combined scheduled task that processes both repos sequentially"""
-    global is_task_running
-    
-    if is_task_running:
-        print("Previous task still running, skipping this execution")
-        return
-    
-    is_task_running = True
-    print(f"Running scheduled check for both repos at {datetime.now()}")
-    try:
-        new_data = await fetch_json_from_url(JSON_URL_1)
-        if os.path.exists(PREVIOUS_DATA_FILE):
+    async def _channel_worker(self, channel_id: int, queue: asyncio.Queue):
+        while True:
             try:
-                with open(PREVIOUS_DATA_FILE, 'r', encoding='utf-8') as file:
-                    old_data = json.load(file)
-                print(f"Previous data loaded from {PREVIOUS_DATA_FILE}.")
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                print(f"Error reading or decoding previous data file {PREVIOUS_DATA_FILE}: {e}. Starting fresh.")
-                old_data = []
-        else:
-            old_data = []
-            print(f"No previous data found at {PREVIOUS_DATA_FILE}. Initializing.")
-
-        await process_repo_updates(new_data, old_data, PREVIOUS_DATA_FILE, JSON_URL_1, is_second_repo=False)
-        
-        new_data_2 = await fetch_json_from_url(JSON_URL_2)
-        if os.path.exists(PREVIOUS_DATA_FILE_2):
+                guild_id, message_content, on_done = await asyncio.wait_for(queue.get(), timeout=CHANNEL_WORKER_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._queues[channel_id]
+                    del self._workers[channel_id]
+                    return
+                continue
+            delivered = False
+            try:
+                delivered = await self._deliver(guild_id, channel_id, message_content)
+            except Exception as e:
+                print(f"Error delivering message to channel {channel_id} in guild {guild_id}: {e}")
+            try:
+                if on_done is not None:
+                    await on_done(delivered)
+            except Exception as e:
+                print(f"Error completing delivery to channel {channel_id} in guild {guild_id}: {e}")
+            finally:
+                queue.task_done()
+                self.pending_count -= 1
+                self._pending.release()
+
+    async def _deliver(self, guild_id: int, channel_id: int, message_content: str) -> bool:
+        for attempt in range(1, MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            send_started = time.perf_counter()
             try:
-                with open(PREVIOUS_DATA_FILE_2, 'r', encoding='utf-8') as file:
-                    old_data_2 = json.load(file)
-                print(f"Previous data loaded from {PREVIOUS_DATA_FILE_2}.")
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                print(f"Error reading or decoding previous data file {PREVIOUS_DATA_FILE_2}: {e}. Starting fresh.")
-                old_data_2 = []
+                delivered = bool(await self._send_func(message_content, guild_id, channel_id))
+                metrics.observe('send_seconds', time.perf_counter() - send_started)
+                metrics.inc('sends_total', result='ok' if delivered else 'failed')
+                return delivered
+            except discord.RateLimited as e:
+                metrics.inc('rate_limited_total')
+                print(f"Rate limited on channel {channel_id} (attempt {attempt}/{MAX_RETRIES}), retrying in {e.retry_after:.2f}s.")
+                await asyncio.sleep(e.retry_after)
+        print(f"Dropping message for channel {channel_id} in guild {guild_id} after {MAX_RETRIES} rate-limited attempts.")
+        metrics.inc('sends_total', result='rate_limited')
+        return False
+
+# The global rate limit is per bot token, so worker processes split it
+if WEBHOOK_DELIVERY:
+    dispatcher = DeliveryDispatcher(
+        send_webhook_message,
+        rate=WEBHOOK_GLOBAL_SEND_RATE / max(1, WORKER_PROCESSES),
+        burst=WEBHOOK_GLOBAL_SEND_RATE / max(1, WORKER_PROCESSES),
+    )
+else:
+    dispatcher = DeliveryDispatcher(
+        send_discord_message,
+        rate=GLOBAL_SEND_RATE / max(1, WORKER_PROCESSES),
+        burst=GLOBAL_SEND_BURST / max(1, WORKER_PROCESSES),
+    )
+# In webhook mode, channels without a webhook are sent to with the bot token, which keeps its global limit
+bot_fallback_bucket = TokenBucket(GLOBAL_SEND_RATE / max(1, WORKER_PROCESSES), GLOBAL_SEND_BURST / max(1, WORKER_PROCESSES))
+metrics.register_gauge('dispatcher_pending_messages', lambda: dispatcher.pending_count)
+metrics.register_gauge('dispatcher_channel_queues', lambda: len(dispatcher.queue_depths()))
+metrics.register_gauge('failed_channels', channel_health.blocked_count)
+
+def _truncate_message(message: str, limit: int = DISCORD_MESSAGE_LIMIT) -> str:
+    return message if len(message) <= limit else message[:limit - 1] + "…"
+
+def build_digest_batches(messages: list[str], backlog: int = 0, max_items: int = DIGEST_MAX_ITEMS_PER_CHANNEL,
+                         limit: int = DISCORD_MESSAGE_LIMIT) -> list[tuple[str, list[int]]]:
+    """Packs messages into as few Discord messages as fit the character limit.
+    The first `backlog` messages are catch-up from before the current cycle: only max_items of them
+    are shown and the rest are summarized in a footer. Every current message is sent.
+    Returns (content, indexes of the messages it covers) pairs."""
+    shown_backlog = min(backlog, max_items)
+    entries = [(message, [index]) for index, message in enumerate(messages[:shown_backlog])]
+    overflow = backlog - shown_backlog
+    if overflow > 0:
+        footer = f"…and {overflow} more earlier update{'s' if overflow != 1 else ''}."
+        entries.append((footer, list(range(shown_backlog, backlog))))
+    entries.extend((message, [index]) for index, message in enumerate(messages[backlog:], start=backlog))
+
+    batches = []
+    current = ""
+    covered = []
+    for entry, indexes in entries:
+        entry = _truncate_message(entry, limit)
+        candidate = f"{current}{DIGEST_SEPARATOR}{entry}" if current else entry
+        if len(candidate) <= limit:
+            current = candidate
         else:
-            old_data_2 = []
-            print(f"No previous data found at {PREVIOUS_DATA_FILE_2}. Initializing.")
-
-        await process_repo_updates(new_data_2, old_data_2, PREVIOUS_DATA_FILE_2, JSON_URL_2, is_second_repo=True)
-        
-    except Exception as e:
-        is_task_running = False
-        print(f"Error during combined scheduled task: {e}")
+            batches.append((current, covered))
+            current, covered = entry, []
+        covered.extend(indexes)
+    if current:
+        batches.append((current, covered))
+    return batches
+
+# --- Notification Outbox ---
+outbox_wakeup = asyncio.Event()
+outbox_in_flight: set[int] = set()  # Outbox row ids claimed by this process but not yet settled
+metrics.register_gauge('outbox_in_flight_rows', lambda: len(outbox_in_flight))
+
+def build_outbox_row(source_name: str, event: ListingEvent, guild_id: int, channel_id: int, content: str, now: float) -> dict:
+    return {
+        'idempotency_key': f"{source_name}:{event.kind}:{event.listing_id}:{event.fingerprint}:{guild_id}:{channel_id}",
+        'guild_id': guild_id,
+        'channel_id': channel_id,
+        'content': content,
+        'status': OUTBOX_PENDING,
+        'attempts': 0,
+        'created_at': now,
+        'next_attempt_at': now,
+    }
+
+async def settle_outbox_rows(row_ids: list[int], delivered: bool):
+    """Marks rows sent, or schedules a retry with exponential backoff until OUTBOX_MAX_ATTEMPTS"""
+    now = time.time()
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                if delivered:
+                    await session.execute(
+                        update(OutboxMessage).where(OutboxMessage.id.in_(row_ids)).values(status=OUTBOX_SENT)
+                    )
+                    metrics.inc('outbox_settled_total', len(row_ids), status=OUTBOX_SENT)
+                    return
+                result = await session.execute(
+                    select(OutboxMessage.id, OutboxMessage.attempts).where(OutboxMessage.id.in_(row_ids))
+                )
+                for row in result.all():
+                    attempts = row.attempts + 1
+                    if attempts >= OUTBOX_MAX_ATTEMPTS:
+                        values = {'attempts': attempts, 'status': OUTBOX_FAILED}
+                        metrics.inc('outbox_settled_total', status=OUTBOX_FAILED)
+                    else:
+                        values = {'attempts': attempts, 'status': OUTBOX_PENDING,
+                                  'next_attempt_at': now + OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)}
+                    await session.execute(update(OutboxMessage).where(OutboxMessage.id == row.id).values(**values))
     finally:
-        is_task_running = False
-        print(f"Scheduled task completed at {datetime.now()}")
+        outbox_in_flight.difference_update(row_ids)
 
-def try_start_scheduled_task():
-    """Function to start scheduled task only if not already running"""
-    if not is_task_running:
-        asyncio.create_task(combined_scheduled_task())
-    else:
-        print("Scheduled task already running, skipping")
-
-async def process_repo_updates(new_data, old_data, previous_data_file, repo_url, is_second_repo=False):
-    """Process updates for a single repo"""
-    new_roles = []
-    deactivated_roles = []
-    reactivated_roles = [] 
+async def defer_outbox_rows(row_ids: list[int], until: float):
+    """Returns rows to pending until a channel's transient block ends, without spending an attempt"""
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(OutboxMessage).where(OutboxMessage.id.in_(row_ids))
+                    .values(status=OUTBOX_PENDING, next_attempt_at=until)
+                )
+        metrics.inc('outbox_deferred_total', len(row_ids))
+    finally:
+        outbox_in_flight.difference_update(row_ids)
 
-    old_roles_dict = {role['id']: role for role in old_data if 'id' in role and role['id'] is not None}
-    guild_ping_roles = await get_all_guild_ping_roles()
+async def prune_outbox():
+    """Deletes settled rows older than the retention window"""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                delete(OutboxMessage)
+                .where(OutboxMessage.status.in_((OUTBOX_SENT, OUTBOX_FAILED)))
+                .where(OutboxMessage.created_at < time.time() - OUTBOX_RETENTION_SECONDS)
+            )
 
-    for new_role in new_data:
-        if 'id' not in new_role or new_role['id'] is None:
+def _local_shard_filter():
+    """SQL condition selecting outbox rows for guilds on this process's shards"""
+    if not SHARD_COUNT or SHARD_IDS is None:
+        return true()
+    return ((OutboxMessage.guild_id.op('>>')(22)) % SHARD_COUNT).in_(SHARD_IDS)
+
+async def drain_outbox() -> int:
+    """Claims every due row of the channels with the oldest due rows and hands them to the dispatcher,
+    packed per channel into digests. The digest item cap applies only to a channel's catch-up rows.
+    Returns the number of rows claimed."""
+    now = time.time()
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(OutboxMessage.channel_id)
+                .where(OutboxMessage.status.in_(OUTBOX_UNSETTLED))
+                .where(OutboxMessage.next_attempt_at <= now)
+                .where(_local_shard_filter())
+                .group_by(OutboxMessage.channel_id)
+                .order_by(func.min(OutboxMessage.id))
+                .limit(OUTBOX_CHANNELS_PER_DRAIN)
+            )
+            channel_ids = result.scalars().all()
+            rows = []
+            if channel_ids:
+                # Claimed in the same statement that reads them, so a later drain cannot pick them up again
+                result = await session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.channel_id.in_(channel_ids))
+                    .where(OutboxMessage.status.in_(OUTBOX_UNSETTLED))
+                    .where(OutboxMessage.next_attempt_at <= now)
+                    .values(status=OUTBOX_CLAIMED, next_attempt_at=now + OUTBOX_CLAIM_SECONDS)
+                    .returning(OutboxMessage.id, OutboxMessage.guild_id, OutboxMessage.channel_id,
+                               OutboxMessage.content, OutboxMessage.created_at)
+                    .execution_options(synchronize_session=False)
+                )
+                # A claim can expire while its rows still wait in the dispatcher; claiming them again only renews the lease
+                rows = sorted((row for row in result.all() if row.id not in outbox_in_flight), key=lambda row: row.id)
+            pending_count = await session.scalar(
+                select(func.count()).select_from(OutboxMessage).where(OutboxMessage.status.in_(OUTBOX_UNSETTLED))
+            )
+    metrics.set_gauge('outbox_pending_rows', pending_count)
+
+    by_channel = {}
+    for row in rows:
+        by_channel.setdefault((row.guild_id, row.channel_id), []).append(row)
+
+    for (guild_id, channel_id), channel_rows in by_channel.items():
+        # Catch-up rows go first, so the digest cap applies to them and never to the current cycle
+        backlog = sum(1 for row in channel_rows if row.created_at < now - DIGEST_BACKLOG_SECONDS)
+        channel_rows.sort(key=lambda row: row.created_at >= now - DIGEST_BACKLOG_SECONDS)
+        row_ids = [row.id for row in channel_rows]
+        outbox_in_flight.update(row_ids)
+        if channel_health.is_gone(guild_id, channel_id):
+            await settle_outbox_rows(row_ids, False)
+            continue
+        if channel_health.is_blocked(guild_id, channel_id):
+            await defer_outbox_rows(row_ids, channel_health.blocked_until(guild_id, channel_id))
             continue
 
-        old_role = old_roles_dict.get(new_role['id'])
-        new_role_is_active = _is_value_truthy(new_role.get('active', True))
-        new_role_is_visible = _is_value_truthy(new_role.get('is_visible', True))
-
-        if old_role:
-            old_role_is_active = _is_value_truthy(old_role.get('active', True))
-
-            if old_role_is_active and not new_role_is_active:
-                deactivated_roles.append(new_role)
-            elif is_second_repo and not old_role_is_active and new_role_is_active and new_role_is_visible:
-                reactivated_roles.append(new_role)
-        elif new_role_is_visible and new_role_is_active: 
-            new_roles.append(new_role)
-
-    loop = client.loop if client and client.loop.is_running() else asyncio.get_event_loop()
-
-    for role in new_roles:
-        channel_configs = await get_all_channels_from_db()
-        for guild_id, channel_id in channel_configs:
-            if f"{guild_id}:{channel_id}" not in failed_channels:
-                message = format_message(role, guild_id, guild_ping_roles)
-                loop.create_task(send_discord_message(message, guild_id, channel_id))
-
-    for role in deactivated_roles:
-        message = format_deactivation_message(role)
-        loop.create_task(send_messages_to_all_configured_channels(message, guild_ping_roles))
-
-    if is_second_repo:
-        for role in reactivated_roles:
-            channel_configs = await get_all_channels_from_db()
-            for guild_id, channel_id in channel_configs:
-                if f"{guild_id}:{channel_id}" not in failed_channels:
-                    message = format_reactivation_message(role, guild_id, guild_ping_roles)
-                    loop.create_task(send_discord_message(message, guild_id, channel_id))
+        messages = [row.content for row in channel_rows]
+        if DIGEST_MODE:
+            batches = build_digest_batches(messages, backlog=backlog)
+        else:
+            batches = [(message, [index]) for index, message in enumerate(messages)]
+        for content, indexes in batches:
+            batch_ids = [row_ids[index] for index in indexes]
+            await dispatcher.enqueue(
+                guild_id, channel_id, content,
+                on_done=lambda delivered, batch_ids=batch_ids: settle_outbox_rows(batch_ids, delivered),
+            )
+    return len(rows)
 
-    try:
-        with open(previous_data_file, 'w', encoding='utf-8') as file:
-            json.dump(new_data, file, indent=2) 
-        print(f"Updated previous data with new data for {previous_data_file}.")
-    except IOError as e:
-        print(f"Error writing previous data file {previous_data_file}: {e}")
+async def outbox_worker():
+    """Drains the outbox whenever a cycle enqueues notifications, and periodically for retries"""
+    drains = 0
+    while True:
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        outbox_wakeup.clear()
+        try:
+            await drain_outbox()
+            drains += 1
+            if drains % 1000 == 0:
+                await prune_outbox()
+                await prune_announcement_keys()
+                if IS_PRIMARY_PROCESS:
+                    await channel_health.prune()
+        except Exception as e:
+            print(f"Error draining notification outbox: {e}")
 
-    if not new_roles and not deactivated_roles and (not is_second_repo or not reactivated_roles):
-        print(f"No updates found for {repo_url}.")
+# --- Scheduled Tasks ---
+source_locks: dict[str, asyncio.Lock] = {}  # source name -> lock held while the source is fetched and diffed
+
+async def process_source(source: ListingSource) -> bool:
+    """Fetch one source and diff it against its snapshot. Returns True if any listing changed.
+    Runs of the same source are serialized, so a slow cycle delays the next one instead of overlapping it."""
+    async with source_locks.setdefault(source.name, asyncio.Lock()):
+        new_data = await fetch_json_from_url(source.url, source.name)
+        if new_data is None:
+            print(f"Skipping update processing for {source.name}.")
+            return False
+
+        old_index = await load_previous_snapshot(source)
+        changes = await process_repo_updates(new_data, old_index, source)
+        mark_fetch_processed(source.url)
+        return bool(changes.events)
+
+class AdaptivePollInterval:
+    """Polling interval for one source: drops to the minimum after a change and grows
+    by POLL_BACKOFF_FACTOR for every quiet poll, up to the maximum"""
+
+    def __init__(self, source: ListingSource):
+        self.minimum = source.min_poll_interval
+        self.maximum = max(source.max_poll_interval, self.minimum)
+        self.current = min(max(source.poll_interval, self.minimum), self.maximum)
+
+    def record(self, changed: bool) -> float:
+        if changed:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * POLL_BACKOFF_FACTOR, self.maximum)
+        return self.current
 
+    def next_delay(self) -> float:
+        return self.current * random.uniform(1 - POLL_JITTER_RATIO, 1 + POLL_JITTER_RATIO)
 
-async def background_scheduler():
-    # Single scheduled job that handles both repos
-    schedule.every(1).minutes.do(try_start_scheduled_task)
-    
-    memory_check_counter = 0
+async def poll_source_forever(source: ListingSource):
+    """Polls one source on its own adaptive schedule; the next poll is only scheduled once this one finished"""
+    interval = AdaptivePollInterval(source)
+    await asyncio.sleep(random.uniform(0, POLL_JITTER_RATIO * interval.current)) # Spread sources out at startup
     while True:
-        schedule.run_pending()
-        await asyncio.sleep(1)
-
-        memory_check_counter += 1
-        if memory_check_counter % 300 == 0: # Approx every 5 minutes (300 seconds)
-            current_mem, peak_mem = tracemalloc.get_traced_memory()
-            peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-            peak_rss_display = peak_rss_kb / 1024 if os.uname().sysname == 'Darwin' else peak_rss_kb
-            
-            print(f"--- Memory Usage ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ---")
-            print(f"Current Python memory (tracemalloc): {current_mem / 1024:.2f} KB")
-            print(f"Peak Python memory (tracemalloc):    {peak_mem / 1024:.2f} KB")
-            print(f"Peak RSS (OS):                       {peak_rss_display:.2f} KB")
-            print("---------------------------------------------------")
+        started = time.perf_counter()
+        changed = False
+        try:
+            changed = await process_source(source)
+        except Exception as e:
+            metrics.inc('source_errors_total', source=source.name)
+            print(f"Error processing source {source.name}: {type(e).__name__} - {e}")
+        metrics.observe('cycle_seconds', time.perf_counter() - started, source=source.name)
+        await memory_profiler.cycle_finished(source.name)
+        interval.record(changed)
+        metrics.set_gauge('poll_interval_seconds', interval.current, source=source.name)
+        delay = interval.next_delay()
+        print(f"Next check for {source.name} in {delay:.0f}s.")
+        await asyncio.sleep(delay)
+
+async def process_repo_updates(new_data: dict, old_index: dict, source: ListingSource) -> ChangeSet:
+    """Process updates for a single source, given the new id -> role index and the
+    previous {listing_id: (fingerprint, active)} snapshot index"""
+    with metrics.timer('diff_seconds', source=source.name):
+        changes = await diff_listings(new_data, old_index, source)
+    for kind, count in changes.counts().items():
+        metrics.inc('listing_events_total', count, source=source.name, kind=kind)
+    if WORKER_PROCESSES > 1:
+        await guild_config_cache.refresh_if_stale() # Slash commands may have been handled by another process
+        await channel_health.load() # Deliveries, and so channel failures, happen in every process
+    else:
+        await channel_health.ensure_loaded()
+    guild_ping_roles = await get_all_guild_ping_roles()
+    await guild_config_cache.ensure_loaded()
+    unfiltered_channels = guild_config_cache.unfiltered_channels()
+
+    display_date = datetime.now().strftime('%b %d')
+    events = [event for event in changes.events if event.kind != EVENT_UPDATED or ANNOUNCE_UPDATES]
+    event_keys = [dedup_keys(event.role) for event in events]
+    outbox_rows = []
+    announcement_rows = []
+    event_rows = []
+    duplicates = 0
+    # Another source may announce the same posting concurrently; its keys must be committed before ours are checked
+    async with announcement_lock:
+        now = time.time()
+        announced = await load_recent_announcements({key for keys in event_keys for key in keys}, now)
+        render_started = time.perf_counter()
+        rows_since_yield = 0
+        for event, keys in zip(events, event_keys):
+            if rows_since_yield >= RENDER_YIELD_ROWS:
+                await asyncio.sleep(0) # Large fan-outs yield so interactions are not stalled
+                rows_since_yield = 0
+            owner = (source.name, event.listing_id)
+            # Listings of the same feed are distinct postings even when they share a URL or title
+            duplicate = any(announced.get((event.kind, key), owner)[0] != source.name for key in keys)
+            if event.kind in HISTORY_EVENT_KINDS:
+                event_rows.append(build_event_log_row(source.name, event, now, duplicate))
+            if duplicate:
+                duplicates += 1
+                continue
+            for key in keys:
+                announced[(event.kind, key)] = owner
+                announcement_rows.append({'kind': event.kind, 'dedup_key': key, 'source': source.name,
+                                          'listing_id': event.listing_id, 'announced_at': now})
+
+            rendered = render_event(event, display_date)
+            attributes = listing_attributes(event.role, rendered.matched_companies or None)
+            for guild_id, channel_id in guild_config_cache.channels_for_listing(attributes, unfiltered_channels):
+                if channel_health.is_gone(guild_id, channel_id, now):
+                    continue # Transiently blocked channels still get rows; drain_outbox holds them until the block ends
+                content = rendered.for_guild(guild_id, guild_ping_roles)
+                outbox_rows.append(build_outbox_row(source.name, event, guild_id, channel_id, content, now))
+                rows_since_yield += 1
+        metrics.observe('render_seconds', time.perf_counter() - render_started, source=source.name)
+
+        # Notifications are committed together with the snapshot: a crash either loses both or keeps both
+        with metrics.timer('snapshot_commit_seconds', source=source.name):
+            await save_snapshot_changes(source.name, changes.changed_rows, changes.removed_ids, outbox_rows, announcement_rows,
+                                        event_rows)
+    metrics.inc('outbox_enqueued_total', len(outbox_rows), source=source.name)
+    metrics.inc('duplicates_suppressed_total', duplicates, source=source.name)
+    print(f"Updated snapshot for {source.name}: {len(changes.changed_rows)} changed, {len(changes.removed_ids)} removed, "
+          f"{len(outbox_rows)} notifications queued, {duplicates} duplicates of other listings skipped.")
+    if outbox_rows:
+        outbox_wakeup.set()
+
+    if changes.events:
+        summary = ', '.join(f"{count} {kind}" for kind, count in changes.counts().items())
+        print(f"Changes found for {source.name}: {summary}.")
+    else:
+        print(f"No updates found for {source.name} ({source.url}).")
+    return changes
+
+
+def report_memory_usage():
+    current_mem, peak_mem = tracemalloc.get_traced_memory()
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_display = peak_rss_kb / 1024 if os.uname().sysname == 'Darwin' else peak_rss_kb
+    if tracemalloc.is_tracing():
+        metrics.set_gauge('tracemalloc_current_bytes', current_mem)
+        metrics.set_gauge('tracemalloc_peak_bytes', peak_mem)
+    metrics.set_gauge('peak_rss_kilobytes', peak_rss_display)
+    if METRICS_PORT:
+        return # Exposed on the metrics endpoint instead of stdout
+
+    print(f"--- Memory Usage ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ---")
+    if tracemalloc.is_tracing():
+        print(f"Current Python memory (tracemalloc): {current_mem / 1024:.2f} KB")
+        print(f"Peak Python memory (tracemalloc):    {peak_mem / 1024:.2f} KB")
+    print(f"Peak RSS (OS):                       {peak_rss_display:.2f} KB")
+    print("---------------------------------------------------")
+
+class MemoryProfiler:
+    """Allocation tracing that can be switched on and off at runtime. While tracing, the traced heap is
+    snapshotted after every poll cycle, so a report shows the top allocating call sites and what grew
+    between the last two cycles. Costs nothing while tracing is off."""
+
+    SNAPSHOT_FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    )
+
+    def __init__(self):
+        self._previous = None  # (source name, snapshot) after the cycle before the latest one
+        self._latest = None  # (source name, snapshot) after the latest cycle
+        self._cycles = 0
+
+    def start(self) -> bool:
+        """Starts tracing; returns False if it was already on"""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start()
+        self._previous = self._latest = None
+        self._cycles = 0
+        return True
+
+    def stop(self) -> bool:
+        """Stops tracing and drops the snapshots; returns False if it was already off"""
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        self._previous = self._latest = None
+        return True
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self.SNAPSHOT_FILTERS)
+
+    async def cycle_finished(self, source_name: str):
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = await run_in_pipeline(self._take_snapshot)
+        self._previous, self._latest = self._latest, (source_name, snapshot)
+        self._cycles += 1
+
+    async def report(self, limit: int = MEMORY_PROFILE_TOP) -> str:
+        if not tracemalloc.is_tracing():
+            return "Memory profiling is off."
+        current_mem, peak_mem = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current_mem / 1024:.1f} KB current, {peak_mem / 1024:.1f} KB peak, "
+                 f"{self._cycles} cycles since profiling started."]
+        if self._latest is None:
+            label, snapshot = "now", await run_in_pipeline(self._take_snapshot)
+        else:
+            label, snapshot = f"after the last {self._latest[0]} cycle", self._latest[1]
+
+        lines.append(f"Top allocating call sites {label}:")
+        for stat in snapshot.statistics('lineno')[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f"  {frame.filename}:{frame.lineno}: {stat.size / 1024:.1f} KB in {stat.count} blocks")
+
+        if self._previous is not None:
+            lines.append(f"Growth since the {self._previous[0]} cycle before it:")
+            growth = [stat for stat in snapshot.compare_to(self._previous[1], 'lineno') if stat.size_diff > 0]
+            for stat in growth[:limit]:
+                frame = stat.traceback[0]
+                lines.append(f"  {frame.filename}:{frame.lineno}: +{stat.size_diff / 1024:.1f} KB ({stat.count_diff:+d} blocks)")
+            if not growth:
+                lines.append("  Nothing grew.")
+        return "\n".join(lines)
+
+memory_profiler = MemoryProfiler()
+
+async def memory_report_loop():
+    while True:
+        await asyncio.sleep(MEMORY_REPORT_SECONDS)
+        report_memory_usage()
+
+async def background_scheduler():
+    """Runs one polling loop per source, plus the periodic memory report"""
+    await asyncio.gather(*(poll_source_forever(source) for source in SOURCES), memory_report_loop())
 
 # --- Slash Commands ---
 @tree.command(name="set_channel", description="Sets the notification channel for this guild (Admin only).")
 @app_commands.describe(channel="The text channel to receive notifications. Leave empty to remove the current channel.")
 async def set_channel_cmd(interaction: discord.Interaction, channel: discord.TextChannel | None = None):
     try:
+        current_channel_id = await get_guild_channel(interaction.guild.id)
+        if current_channel_id and guild_config_cache.webhook_for(current_channel_id) and (channel is None or channel.id != current_channel_id):
+            await set_channel_webhook(interaction.guild.id, current_channel_id, None)
         if channel:
             await set_guild_channel(interaction.guild.id, channel.id)
+            if WEBHOOK_DELIVERY:
+                try:
+                    await set_channel_webhook(interaction.guild.id, channel.id, await ensure_channel_webhook(channel))
+                except discord.Forbidden:
+                    await interaction.response.send_message(
+                        f"Notification channel set to {channel.mention}. Grant me **Manage Webhooks** there and run this "
+                        "command again to deliver through a webhook; until then messages are sent by the bot.", ephemeral=True)
+                    return
             await interaction.response.send_message(f"Notification channel set to {channel.mention}.", ephemeral=True)
         else:
-            current_channel_id = await get_guild_channel(interaction.guild.id)
             if current_channel_id is None:
                 await interaction.response.send_message("No notification channel is currently configured for this guild.", ephemeral=True)
                 return
@@ -595,45 +2802,250 @@ async def get_ping_role_cmd(interaction: discord.Interaction):
     except Exception as e:
         await interaction.response.send_message(f"Error getting ping role: {e}", ephemeral=True)
 
+@tree.command(name="watch_company", description="Adds a company to this guild's ping watchlist (Admin only).")
+@app_commands.describe(company="Company name to ping for, matched as a whole word (e.g. \"jane street\").")
+async def watch_company_cmd(interaction: discord.Interaction, company: str):
+    try:
+        term = normalize_company_term(company)
+        if not term:
+            await interaction.response.send_message("Please provide a company name.", ephemeral=True)
+            return
+        await set_guild_watch(interaction.guild.id, term, True)
+        await interaction.response.send_message(f"Added `{term}` to this guild's watchlist.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error updating watchlist: {e}", ephemeral=True)
+
+@tree.command(name="unwatch_company", description="Removes a company from this guild's ping watchlist (Admin only).")
+@app_commands.describe(company="Company name to stop pinging for.")
+async def unwatch_company_cmd(interaction: discord.Interaction, company: str):
+    try:
+        term = normalize_company_term(company)
+        if term not in await get_guild_watchlist(interaction.guild.id):
+            await interaction.response.send_message(f"`{term}` is not on this guild's watchlist.", ephemeral=True)
+            return
+        await set_guild_watch(interaction.guild.id, term, False)
+        await interaction.response.send_message(f"Removed `{term}` from this guild's watchlist.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error updating watchlist: {e}", ephemeral=True)
+
+@tree.command(name="watchlist", description="Shows the companies this guild pings for in addition to big tech.")
+async def watchlist_cmd(interaction: discord.Interaction):
+    try:
+        watchlist = await get_guild_watchlist(interaction.guild.id)
+        if watchlist:
+            await interaction.response.send_message(f"Watched companies: {', '.join(f'`{term}`' for term in watchlist)}", ephemeral=True)
+        else:
+            await interaction.response.send_message("This guild's watchlist is empty. Big tech companies are always pinged.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error getting watchlist: {e}", ephemeral=True)
+
+FILTER_FIELD_CHOICES = [
+    app_commands.Choice(name="Season / term (e.g. summer 2026)", value=FILTER_SEASON),
+    app_commands.Choice(name="Location (e.g. new york, remote)", value=FILTER_LOCATION),
+    app_commands.Choice(name="Sponsorship (e.g. offers sponsorship)", value=FILTER_SPONSORSHIP),
+    app_commands.Choice(name="Company", value=FILTER_COMPANY),
+    app_commands.Choice(name="Title keyword (one or two words)", value=FILTER_KEYWORD),
+]
+
+@tree.command(name="subscribe", description="Only receive listings matching a filter; repeat to accept more values (Admin only).")
+@app_commands.describe(field="What to filter on.", value="Accepted value. Values of the same field are alternatives.")
+@app_commands.choices(field=FILTER_FIELD_CHOICES)
+async def subscribe_cmd(interaction: discord.Interaction, field: app_commands.Choice[str], value: str):
+    try:
+        term = normalize_company_term(value) if field.value == FILTER_COMPANY else normalize_filter_value(value)
+        if not term:
+            await interaction.response.send_message("Please provide a value to filter on.", ephemeral=True)
+            return
+        if field.value == FILTER_KEYWORD and len(term.split()) > 2:
+            await interaction.response.send_message("Title keywords can be at most two words.", ephemeral=True)
+            return
+        await set_guild_filter(interaction.guild.id, field.value, term, True)
+        await interaction.response.send_message(f"This guild now receives listings whose {field.value} matches `{term}`.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error updating filters: {e}", ephemeral=True)
+
+@tree.command(name="unsubscribe", description="Removes a value from this guild's subscription filters (Admin only).")
+@app_commands.describe(field="Filter to change.", value="Value to remove.")
+@app_commands.choices(field=FILTER_FIELD_CHOICES)
+async def unsubscribe_cmd(interaction: discord.Interaction, field: app_commands.Choice[str], value: str):
+    try:
+        term = normalize_company_term(value) if field.value == FILTER_COMPANY else normalize_filter_value(value)
+        if term not in (await get_guild_filters(interaction.guild.id)).get(field.value, []):
+            await interaction.response.send_message(f"`{term}` is not a {field.value} filter for this guild.", ephemeral=True)
+            return
+        await set_guild_filter(interaction.guild.id, field.value, term, False)
+        await interaction.response.send_message(f"Removed `{term}` from this guild's {field.value} filter.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error updating filters: {e}", ephemeral=True)
+
+@tree.command(name="filters", description="Shows this guild's subscription filters.")
+async def filters_cmd(interaction: discord.Interaction):
+    try:
+        filters = await get_guild_filters(interaction.guild.id)
+        if filters:
+            lines = [f"**{field}:** {', '.join(f'`{value}`' for value in filters[field])}" for field in FILTER_FIELDS if field in filters]
+            await interaction.response.send_message("Listings must match every filter below:\n" + "\n".join(lines), ephemeral=True)
+        else:
+            await interaction.response.send_message("This guild has no filters and receives every listing.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error getting filters: {e}", ephemeral=True)
+
+@tree.command(name="clear_filters", description="Removes all subscription filters for this guild (Admin only).")
+async def clear_filters_cmd(interaction: discord.Interaction):
+    try:
+        await clear_guild_filters(interaction.guild.id)
+        await interaction.response.send_message("Filters cleared. This guild receives every listing again.", ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error clearing filters: {e}", ephemeral=True)
+
+@tree.command(name="search", description="Searches current internship listings.")
+@app_commands.describe(
+    company="Company name, or the start of it.",
+    keyword="Words in the title or company name.",
+    location="City, state or \"remote\".",
+    season="Season or term, e.g. \"summer 2026\".",
+    active_only="Only show listings that are still open (default: yes).",
+)
+async def search_cmd(interaction: discord.Interaction, company: str | None = None, keyword: str | None = None,
+                     location: str | None = None, season: str | None = None, active_only: bool = True):
+    try:
+        rows = await search_listings(company, keyword, location, season, active_only)
+        if not rows:
+            await interaction.response.send_message("No listings match that search.", ephemeral=True)
+            return
+        await interaction.response.send_message(format_search_results(rows, f"Top {len(rows)} matching listings, newest first:"), ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error searching listings: {e}", ephemeral=True)
+
+@tree.command(name="latest", description="Shows the most recently posted internships.")
+@app_commands.describe(count=f"How many listings to show (1-{SEARCH_MAX_RESULTS}).", active_only="Only show listings that are still open (default: yes).")
+async def latest_cmd(interaction: discord.Interaction, count: app_commands.Range[int, 1, SEARCH_MAX_RESULTS] = SEARCH_RESULT_LIMIT,
+                     active_only: bool = True):
+    try:
+        rows = await search_listings(active_only=active_only, limit=count)
+        if not rows:
+            await interaction.response.send_message("No listings are known yet.", ephemeral=True)
+            return
+        await interaction.response.send_message(format_search_results(rows, f"Latest {len(rows)} listings:"), ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error getting latest listings: {e}", ephemeral=True)
+
+STATS_REPORT_CHOICES = [
+    app_commands.Choice(name="Listing activity per day", value=STATS_DAILY),
+    app_commands.Choice(name="Top companies by new listings", value=ROLLUP_COMPANY),
+    app_commands.Choice(name="Top seasons by new listings", value=ROLLUP_SEASON),
+]
+STATS_PERIOD_CHOICES = [
+    app_commands.Choice(name="Today", value=STATS_PERIOD_DAY),
+    app_commands.Choice(name="This week", value=STATS_PERIOD_WEEK),
+    app_commands.Choice(name="This month", value=STATS_PERIOD_MONTH),
+]
+
+@tree.command(name="stats", description="Shows listing activity over time.")
+@app_commands.describe(report="What to show.", period="Time range (default: this week).")
+@app_commands.choices(report=STATS_REPORT_CHOICES, period=STATS_PERIOD_CHOICES)
+async def stats_cmd(interaction: discord.Interaction, report: app_commands.Choice[str],
+                    period: app_commands.Choice[str] | None = None):
+    try:
+        message = await build_stats_message(report.value, period.value if period else STATS_PERIOD_WEEK)
+        await interaction.response.send_message(message, ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error getting stats: {e}", ephemeral=True)
+
+MEMORY_PROFILE_ACTIONS = [
+    app_commands.Choice(name="Start tracing allocations", value="start"),
+    app_commands.Choice(name="Stop tracing allocations", value="stop"),
+    app_commands.Choice(name="Show report", value="report"),
+]
+
+@tree.command(name="memory_profile", description="Traces allocations and reports memory growth between cycles (Bot owner only).")
+@app_commands.describe(action="Start or stop tracing, or show the top allocation sites and growth.")
+@app_commands.choices(action=MEMORY_PROFILE_ACTIONS)
+async def memory_profile_cmd(interaction: discord.Interaction, action: app_commands.Choice[str]):
+    try:
+        if not await client.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can profile memory.", ephemeral=True)
+            return
+        if action.value == "start":
+            started = memory_profiler.start()
+            message = "Memory profiling started; the heap is snapshotted after every poll cycle." if started else "Memory profiling is already on."
+        elif action.value == "stop":
+            message = "Memory profiling stopped." if memory_profiler.stop() else "Memory profiling is already off."
+        else:
+            report = _truncate_message(await memory_profiler.report(), DISCORD_MESSAGE_LIMIT - 8)
+            message = f"```\n{report}\n```"
+        await interaction.response.send_message(message, ephemeral=True)
+    except Exception as e:
+        await interaction.response.send_message(f"Error profiling memory: {e}", ephemeral=True)
+
 # --- Bot Event Handlers ---
 async def cleanup_db():
-    """Properly close the database engine"""
+    """Properly close the database engine and the shared HTTP session"""
     await engine.dispose()
     print("Database engine disposed.")
+    await close_http_session()
 
-@client.event
-async def on_ready():
-    print(f"Preparing bot: {client.user}...")
-    await init_db() # Initialize DB on startup
-    
+def command_tree_hash() -> str:
+    """Hash of the command payloads a global sync would upload"""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: command['name'])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+async def sync_commands_if_changed():
+    """Syncs the global command tree only when it differs from the last synced one"""
+    tree_hash = f"{client.application_id}:{command_tree_hash()}"
+    async with async_session() as session:
+        synced_hash = await session.scalar(select(BotState.value).where(BotState.key == COMMAND_TREE_HASH_KEY))
+    if synced_hash == tree_hash:
+        print("Command tree unchanged, skipping sync.")
+        return
     # Sync slash commands. This can be done globally or per-guild.
     # For simplicity, global sync. For faster updates during dev, sync to a specific guild.
     # await tree.sync(guild=discord.Object(id=DISCORD_GUILD_ID)) # Example for guild-specific sync
-    await tree.sync() 
-    
-    print(f"Logged in as {client.user} (ID: {client.user.id})")
+    await tree.sync()
+    async with async_session() as session:
+        await session.execute(
+            sqlite_insert(BotState)
+            .values(key=COMMAND_TREE_HASH_KEY, value=tree_hash)
+            .on_conflict_do_update(index_elements=[BotState.key], set_={'value': tree_hash})
+        )
+        await session.commit()
     print("Command tree synced.")
-    
-    # List guilds the bot is in
-    guild_names = [guild.name for guild in client.guilds]
-    if guild_names:
-        print(f"Currently in guilds: {', '.join(guild_names)}")
-    else:
-        print("Currently in no guilds.")
-        
-    print("Bot is ready and listening for commands and scheduled tasks.")
-    
-    # Start the background scheduler task
-    if not hasattr(client, '_scheduler_task_started'): # Ensure it only starts once
-        client._scheduler_task_started = True
+
+@client.event
+async def setup_hook():
+    """Runs once after login, before the gateway connects; unlike on_ready it does not repeat on reconnects"""
+    started = time.perf_counter()
+    await init_db() # Initialize DB on startup
+    if IS_PRIMARY_PROCESS: # Commands are global, one process syncs them
+        await sync_commands_if_changed()
+    await asyncio.gather(guild_config_cache.ensure_loaded(), channel_health.ensure_loaded())
+    print(f"Startup prepared in {time.perf_counter() - started:.2f}s.")
+
+@client.event
+async def on_ready():
+    print(f"Logged in as {client.user} (ID: {client.user.id})")
+    if SHARD_COUNT:
+        print(f"Worker {WORKER_INDEX} running shards {SHARD_IDS if SHARD_IDS is not None else 'all'} of {SHARD_COUNT}.")
+    print(f"Currently in {len(client.guilds)} guilds.")
+
+    # on_ready fires again after every reconnect; everything below only runs the first time
+    if hasattr(client, '_scheduler_task_started'):
+        return
+    client._scheduler_task_started = True
+    await warm_channel_cache()
+    if IS_PRIMARY_PROCESS:
         client.loop.create_task(background_scheduler())
         print("Background scheduler started.")
+    client.loop.create_task(outbox_worker())
+    print("Outbox worker started.")
+    if METRICS_PORT:
+        await start_metrics_server(port=METRICS_PORT + WORKER_INDEX)
+    print("Bot is ready and listening for commands and scheduled tasks.")
 
 @client.event
 async def on_disconnect():
-    """Clean up when bot disconnects"""
-    print("Bot disconnected. Cleaning up database connections...")
-    await cleanup_db()
+    # The gateway reconnects on its own; the database and HTTP session stay open until shutdown
+    print("Bot disconnected from the gateway.")
 
 # --- Error Handling for Slash Commands ---
 @tree.error
@@ -655,18 +3067,62 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
             await interaction.response.send_message("An unexpected error occurred. Please try again later.", ephemeral=True)
 
 # Run the bot
+async def run_bot():
+    async with client:
+        try:
+            await client.start(DISCORD_TOKEN)
+        finally:
+            await cleanup_db()
+
+def run_bot_process():
+    """Runs this process's bot client until it is stopped"""
+    print("Starting bot...")
+    try:
+        discord.utils.setup_logging()
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    except discord.LoginFailure:
+        print("CRITICAL ERROR: Login Failure. The provided Discord Bot Token is invalid.")
+        print("Please verify your BOT_TOKEN.")
+    except discord.PrivilegedIntentsRequired:
+        print("CRITICAL ERROR: Privileged Intents Required. Ensure your bot has the necessary intents enabled in the Discord Developer Portal.")
+    except Exception as e:
+        print(f"An unexpected critical error occurred while trying to run the bot: {type(e).__name__} - {e}")
+
+def _run_worker_process():
+    """Entry point of a spawned worker. The child inherited the worker's shard settings through the
+    environment, so the module globals were configured for it when spawn imported this file."""
+    run_bot_process()
+
+def launch_worker_processes():
+    """Starts WORKER_PROCESSES bot processes, each owning every WORKER_PROCESSES-th shard"""
+    import multiprocessing
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for worker_index in range(WORKER_PROCESSES):
+        shard_ids = list(range(worker_index, SHARD_COUNT, WORKER_PROCESSES))
+        env = {
+            "WORKER_INDEX": str(worker_index),
+            "SHARD_COUNT": str(SHARD_COUNT),
+            "SHARD_IDS": ",".join(str(shard_id) for shard_id in shard_ids),
+        }
+        os.environ.update(env) # Read by the child when it imports this module; the launcher itself only joins
+        process = context.Process(target=_run_worker_process, name=f"bot-worker-{worker_index}")
+        process.start()
+        processes.append(process)
+        print(f"Started worker {worker_index} (pid {process.pid}) for shards {shard_ids}.")
+    for process in processes:
+        process.join()
+
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         print("CRITICAL ERROR: BOT_TOKEN is not set in the environment variables or .env file.")
         print("Please ensure your Discord Bot Token is correctly configured.")
+    elif WORKER_PROCESSES > 1 and SHARD_IDS is None:
+        if SHARD_COUNT < WORKER_PROCESSES:
+            print(f"CRITICAL ERROR: SHARD_COUNT ({SHARD_COUNT}) must be at least WORKER_PROCESSES ({WORKER_PROCESSES}).")
+        else:
+            launch_worker_processes()
     else:
-        print("Starting bot...")
-        try:
-            client.run(DISCORD_TOKEN)
-        except discord.LoginFailure:
-            print("CRITICAL ERROR: Login Failure. The provided Discord Bot Token is invalid.")
-            print("Please verify your BOT_TOKEN.")
-        except discord.PrivilegedIntentsRequired:
-            print("CRITICAL ERROR: Privileged Intents Required. Ensure your bot has the necessary intents enabled in the Discord Developer Portal.")
-        except Exception as e:
-            print(f"An unexpected critical error occurred while trying to run the bot: {type(e).__name__} - {e}")
+        run_bot_process()
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+import pytest_asyncio
+
+# mainbot keeps its database and snapshots relative to the working directory
+os.chdir(tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mainbot  # noqa: E402
+
+@pytest_asyncio.fixture
+async def db(monkeypatch):
+    """Empty database with fresh guild config and channel health caches, deleted after the test"""
+    await mainbot.init_db()
+    monkeypatch.setattr(mainbot, 'guild_config_cache', mainbot.GuildConfigCache())
+    monkeypatch.setattr(mainbot, 'channel_health', mainbot.ChannelHealthTracker())
+    yield
+    await mainbot.engine.dispose()
+    mainbot.outbox_in_flight.clear()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(mainbot.DATABASE_FILE + suffix):
+            os.remove(mainbot.DATABASE_FILE + suffix)
+
+class RecordingDispatcher:
+    """Stands in for the dispatcher: keeps queued messages instead of sending them"""
+
+    def __init__(self):
+        self.queued = []  # (guild_id, channel_id, content, on_done)
+
+    async def enqueue(self, guild_id, channel_id, message_content, on_done=None):
+        self.queued.append((guild_id, channel_id, message_content, on_done))
+
+@pytest.fixture
+def dispatcher(db, monkeypatch):
+    recording = RecordingDispatcher()
+    monkeypatch.setattr(mainbot, 'dispatcher', recording)
+    return recording
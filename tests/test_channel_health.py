@@ -0,0 +1,72 @@
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+import mainbot
+from mainbot import CHANNEL_BACKOFF_BASE_SECONDS, CHANNEL_BACKOFF_MAX_SECONDS, MAX_RETRIES, ChannelHealth, ChannelHealthTracker
+
+async def _stored_rows() -> list[ChannelHealth]:
+    async with mainbot.async_session() as session:
+        return list((await session.execute(select(ChannelHealth))).scalars())
+
+def test_backoff_doubles_up_to_the_maximum():
+    assert ChannelHealthTracker._backoff(1, gone=True) == CHANNEL_BACKOFF_BASE_SECONDS
+    assert ChannelHealthTracker._backoff(3, gone=True) == CHANNEL_BACKOFF_BASE_SECONDS * 4
+    assert ChannelHealthTracker._backoff(MAX_RETRIES, gone=False) == CHANNEL_BACKOFF_BASE_SECONDS
+    assert ChannelHealthTracker._backoff(MAX_RETRIES + 2, gone=False) == CHANNEL_BACKOFF_BASE_SECONDS * 4
+    assert ChannelHealthTracker._backoff(100, gone=True) == CHANNEL_BACKOFF_MAX_SECONDS
+
+@pytest.mark.asyncio
+async def test_transient_failures_block_only_after_max_retries(db):
+    health = mainbot.channel_health
+    for _ in range(MAX_RETRIES - 1):
+        assert await health.record_failure(1, 10, 'http_error') == 0.0
+        assert not health.is_blocked(1, 10)
+    assert await health.record_failure(1, 10, 'http_error') == CHANNEL_BACKOFF_BASE_SECONDS
+    assert health.is_blocked(1, 10) and not health.is_gone(1, 10)
+    assert await health.record_failure(1, 10, 'http_error') == CHANNEL_BACKOFF_BASE_SECONDS * 2
+
+@pytest.mark.asyncio
+async def test_gone_channels_block_on_the_first_failure(db):
+    health = mainbot.channel_health
+    assert await health.record_failure(1, 10, 'not_found') == CHANNEL_BACKOFF_BASE_SECONDS
+    assert health.is_gone(1, 10)
+    assert not health.is_blocked(1, 10, now=time.time() + CHANNEL_BACKOFF_BASE_SECONDS + 1)  # Probed again once the block ends
+
+@pytest.mark.asyncio
+async def test_failures_persist_across_reloads(db):
+    await mainbot.channel_health.record_failure(1, 10, 'forbidden')
+    reloaded = ChannelHealthTracker()
+    await reloaded.load()
+    assert reloaded.is_gone(1, 10)
+
+@pytest.mark.asyncio
+async def test_success_clears_the_row(db):
+    health = mainbot.channel_health
+    await health.record_failure(1, 10, 'not_found')
+    await health.record_success(1, 10)
+    assert not health.is_blocked(1, 10)
+    assert await _stored_rows() == []
+
+@pytest.mark.asyncio
+async def test_prune_unconfigures_channels_gone_for_the_prune_period(db):
+    await mainbot.set_guild_channel(1, 10)
+    await mainbot.set_guild_channel(2, 20)
+    await mainbot.set_guild_channel(3, 30)
+    health = mainbot.channel_health
+    await health.record_failure(1, 10, 'not_found')
+    await health.record_failure(2, 20, 'not_found')
+    for _ in range(MAX_RETRIES):
+        await health.record_failure(3, 30, 'http_error')
+    long_ago = time.time() - mainbot.CHANNEL_PRUNE_DAYS * 24 * 3600 - 60
+    async with mainbot.async_session() as session:
+        async with session.begin():
+            await session.execute(update(ChannelHealth).where(ChannelHealth.channel_id != 20).values(first_failed_at=long_ago))
+    await health.load()
+
+    assert await health.prune() == 1
+    assert await mainbot.get_guild_channel(1) is None
+    assert await mainbot.get_guild_channel(2) == 20  # Gone, but not for long enough
+    assert await mainbot.get_guild_channel(3) == 30  # Failing for long, but not gone
+    assert sorted(row.channel_id for row in await _stored_rows()) == [20, 30]
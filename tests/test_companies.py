@@ -0,0 +1,42 @@
+import pytest
+
+import mainbot
+from mainbot import BIG_TECH_TERMS, FILTER_COMPANY, CompanyMatcher, SubscriptionIndex, listing_attributes
+
+@pytest.fixture
+def guilds(monkeypatch):
+    """Guild 1 watches "amazon web services", guild 2 filters on "goldman sachs" and guild 3 on "goldman"."""
+    subscriptions = SubscriptionIndex()
+    subscriptions.add(2, FILTER_COMPANY, "goldman sachs")
+    subscriptions.add(3, FILTER_COMPANY, "goldman")
+    monkeypatch.setattr(mainbot.guild_config_cache, '_watchlists', {1: {"amazon web services"}})
+    monkeypatch.setattr(mainbot.guild_config_cache, 'subscriptions', subscriptions)
+    monkeypatch.setattr(mainbot.guild_config_cache, 'watchlist_version', mainbot.guild_config_cache.watchlist_version + 1)
+    return subscriptions
+
+@pytest.mark.parametrize("text, expected", [
+    ("HP Inc", {"hp"}),
+    ("Chipotle", set()),
+    ("Snapchat", set()),
+    ("Jane  Street Capital", {"jane street"}),
+    ("X (formerly Twitter)", {"x", "twitter"}),
+    ("", set()),
+])
+def test_terms_match_whole_words(text, expected):
+    assert CompanyMatcher(BIG_TECH_TERMS).match(text) == expected
+
+def test_overlapping_terms_all_match():
+    matcher = CompanyMatcher(BIG_TECH_TERMS | {"amazon web services"})
+    assert matcher.match("Amazon Web Services") == {"amazon", "amazon web services"}
+
+def test_punctuated_terms():
+    assert CompanyMatcher({"at&t", "c3.ai"}).match("AT&T Labs and C3.ai") == {"at&t", "c3.ai"}
+
+def test_one_guilds_watchlist_does_not_hide_big_tech_from_others(guilds):
+    matched = mainbot.match_companies({"company_name": "Amazon Web Services"})
+    assert mainbot.is_watched_company(1, matched)
+    assert mainbot.is_watched_company(3, matched)  # Still pinged as big tech ("amazon")
+
+def test_longer_company_filter_does_not_hide_shorter_one(guilds):
+    role = {"company_name": "Goldman Sachs", "title": "Analyst Intern"}
+    assert guilds.match(listing_attributes(role, mainbot.match_companies(role))) == {2, 3}
@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import select
+
+import mainbot
+from mainbot import ChangeSet, Listing, ListingSource, OutboxMessage, dedup_keys, normalize_listing_url
+
+FIRST = ListingSource(name="first", url="", snapshot_file="")
+SECOND = ListingSource(name="second", url="", snapshot_file="")
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.Example.com/jobs/123/", "example.com/jobs/123"),
+    ("http://example.com/jobs/123", "example.com/jobs/123"),
+    ("https://example.com/jobs/123?utm_source=x&ref=y&gh_src=z", "example.com/jobs/123"),
+    ("https://example.com/apply?b=2&a=1&UTM_MEDIUM=m", "example.com/apply?a=1&b=2"),
+    ("  https://example.com/jobs/123  ", "example.com/jobs/123"),
+])
+def test_equivalent_urls_normalize_alike(url, expected):
+    assert normalize_listing_url(url) == expected
+
+@pytest.mark.parametrize("url", [None, "", "   ", "#", 123])
+def test_missing_urls(url):
+    assert normalize_listing_url(url) is None
+
+def test_meaningful_query_parameters_are_kept():
+    assert normalize_listing_url("https://example.com/apply?job=1") != normalize_listing_url("https://example.com/apply?job=2")
+
+def _role(listing_id: str, **fields) -> dict:
+    role = {"id": listing_id, "company_name": "Acme Corp", "title": "Software Engineer Intern",
+            "url": f"https://jobs.acme.test/{listing_id}", "locations": ["NYC"], "season": "Summer 2026",
+            "sponsorship": "Other", "active": True, "is_visible": True}
+    role.update(fields)
+    return role
+
+def test_dedup_keys():
+    assert dedup_keys(_role("1", url="https://www.jobs.acme.test/1/?utm_source=x")) == [
+        "url:jobs.acme.test/1", "title:acme corp|software engineer intern|summer",
+    ]
+
+def test_dedup_keys_ignore_term_spelling_but_not_season():
+    summer = dedup_keys(_role("1", season=None, terms=["Summer 2026"]))[1]
+    assert summer == dedup_keys(_role("1", season="Summer"))[1]
+    assert summer != dedup_keys(_role("1", season="Fall 2026"))[1]
+
+def test_dedup_keys_without_url_or_title():
+    assert dedup_keys(_role("1", url="#")) == ["title:acme corp|software engineer intern|summer"]
+    assert dedup_keys(_role("1", title="")) == ["url:jobs.acme.test/1"]
+
+async def _announce(source: ListingSource, *roles: dict) -> ChangeSet:
+    return await mainbot.process_repo_updates({role["id"]: Listing.from_role(role) for role in roles}, {}, source)
+
+async def _outbox_contents() -> list[str]:
+    async with mainbot.async_session() as session:
+        return list((await session.execute(select(OutboxMessage.content).order_by(OutboxMessage.id))).scalars())
+
+@pytest.mark.asyncio
+async def test_posting_seen_in_a_second_source_is_not_announced_again(db):
+    await mainbot.set_guild_channel(1, 10)
+    await _announce(FIRST, _role("a1", url="https://jobs.acme.test/123?utm_source=first"))
+    await _announce(SECOND, _role("b7", url="https://www.jobs.acme.test/123/", title="SWE Intern"))
+    assert len(await _outbox_contents()) == 1
+
+    await _announce(SECOND, _role("b8", title="Data Science Intern", url="https://jobs.acme.test/456"))
+    assert len(await _outbox_contents()) == 2
+
+@pytest.mark.asyncio
+async def test_same_title_from_another_source_is_a_duplicate(db):
+    await mainbot.set_guild_channel(1, 10)
+    await _announce(FIRST, _role("a1"))
+    await _announce(SECOND, _role("b1", url="https://other.test/apply/99"))
+    assert len(await _outbox_contents()) == 1
+
+@pytest.mark.asyncio
+async def test_listings_of_one_source_sharing_a_url_are_all_announced(db):
+    await mainbot.set_guild_channel(1, 10)
+    await _announce(FIRST, _role("a1", url="https://jobs.acme.test/coop"), _role("a2", url="https://jobs.acme.test/coop", title="Co-op II"))
+    assert len(await _outbox_contents()) == 2
+
+@pytest.mark.asyncio
+async def test_duplicates_expire_after_the_window(db, monkeypatch):
+    await mainbot.set_guild_channel(1, 10)
+    await _announce(FIRST, _role("a1"))
+    monkeypatch.setattr(mainbot, 'DEDUP_WINDOW_SECONDS', -1)
+    await _announce(SECOND, _role("b1"))
+    assert len(await _outbox_contents()) == 2
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import mainbot
+from mainbot import EVENT_DEACTIVATED, EVENT_NEW, EVENT_REACTIVATED, EVENT_UPDATED, Listing, ListingSource
+
+TRACKING = ListingSource(name="tracking", url="", snapshot_file="", track_reactivations=True)
+NOT_TRACKING = ListingSource(name="plain", url="", snapshot_file="")
+
+def _role(listing_id="1", **fields) -> dict:
+    role = {"id": listing_id, "company_name": "Acme", "title": "SWE Intern", "url": "https://acme.test/1",
+            "locations": ["NYC"], "season": "Summer 2026", "sponsorship": "Offers Sponsorship",
+            "active": True, "is_visible": True}
+    role.update(fields)
+    return role
+
+def _index(*roles: dict) -> dict:
+    return {role["id"]: Listing.from_role(role) for role in roles}
+
+def _snapshot(*roles: dict) -> dict:
+    return {listing.id: (listing.fingerprint, listing.active) for listing in _index(*roles).values()}
+
+def test_unchanged_listing_produces_nothing():
+    changes, edited = mainbot._diff_index(_index(_role()), _snapshot(_role()), TRACKING)
+    assert changes.events == [] and changes.changed_rows == [] and edited == {}
+
+def test_new_listing():
+    changes, _ = mainbot._diff_index(_index(_role()), {}, TRACKING)
+    assert [(event.kind, event.listing_id) for event in changes.events] == [(EVENT_NEW, "1")]
+    assert len(changes.changed_rows) == 1
+
+@pytest.mark.parametrize("fields", [{"active": False}, {"is_visible": False}])
+def test_inactive_or_hidden_new_listing_is_stored_but_not_announced(fields):
+    changes, _ = mainbot._diff_index(_index(_role(**fields)), {}, TRACKING)
+    assert changes.events == []
+    assert len(changes.changed_rows) == 1
+
+def test_deactivated_listing():
+    changes, edited = mainbot._diff_index(_index(_role(active=False)), _snapshot(_role()), TRACKING)
+    assert [event.kind for event in changes.events] == [EVENT_DEACTIVATED]
+    assert edited == {}
+
+def test_reactivation_only_for_tracking_sources():
+    new_data, snapshot = _index(_role()), _snapshot(_role(active=False))
+    changes, _ = mainbot._diff_index(new_data, snapshot, TRACKING)
+    assert [event.kind for event in changes.events] == [EVENT_REACTIVATED]
+
+    changes, edited = mainbot._diff_index(new_data, snapshot, NOT_TRACKING)
+    assert changes.events == []
+    assert set(edited) == {"1"}
+
+def test_edited_listing_is_left_for_the_update_check():
+    changes, edited = mainbot._diff_index(_index(_role(title="SWE Intern II")), _snapshot(_role()), TRACKING)
+    assert changes.events == []
+    assert set(edited) == {"1"}
+
+def test_removed_ids():
+    changes, _ = mainbot._diff_index(_index(_role("1")), _snapshot(_role("1"), _role("2")), TRACKING)
+    assert changes.removed_ids == {"2"}
+
+def test_material_changes_compare_the_resolved_season():
+    old = _role(season=None, terms=["Summer 2026"])
+    assert mainbot.material_changes(old, Listing.from_role(_role())) == {}
+    assert mainbot.material_changes(old, Listing.from_role(_role(season="Fall 2026"))) == {"season": "Summer 2026"}
+
+def test_material_changes_ignore_non_material_fields():
+    new_role = Listing.from_role(_role(date_posted=1234, company_name="Acme Inc"))
+    assert mainbot.material_changes(_role(), new_role) == {}
+
+def test_diff_listings_reports_material_updates(monkeypatch):
+    old = _role()
+
+    async def load_snapshot_roles(source_name, listing_ids):
+        return {listing_id: old for listing_id in listing_ids}
+
+    monkeypatch.setattr(mainbot, 'load_snapshot_roles', load_snapshot_roles)
+    new_data = _index(_role(title="SWE Intern II", locations=["NYC", "Remote"]), _role("2", date_posted=5))
+    changes = asyncio.run(mainbot.diff_listings(new_data, _snapshot(old, _role("2")), TRACKING))
+
+    [update] = changes.of_kind(EVENT_UPDATED)
+    assert update.listing_id == "1"
+    assert update.changed_fields == ("title", "locations")
+    assert update.previous_values == {"title": "SWE Intern", "locations": ("NYC",)}
+    assert len(changes.changed_rows) == 2  # The non-material edit is still stored
+
+    rendered = mainbot.render_event(update).for_guild(0, {})
+    assert "**Title:** SWE Intern → SWE Intern II" in rendered
+    assert "**Locations:** NYC → NYC, Remote" in rendered
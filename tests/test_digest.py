@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import mainbot
+from mainbot import DIGEST_SEPARATOR, OUTBOX_PENDING, build_digest_batches
+
+def test_messages_are_packed_up_to_the_limit():
+    batches = build_digest_batches(["a" * 40, "b" * 40, "c" * 40], max_items=10, limit=100)
+    assert batches == [(f"{'a' * 40}{DIGEST_SEPARATOR}{'b' * 40}", [0, 1]), ("c" * 40, [2])]
+    assert all(len(content) <= 100 for content, _ in batches)
+
+def test_every_message_is_covered_once():
+    messages = [str(index) * (index % 7 + 1) for index in range(30)]
+    batches = build_digest_batches(messages, max_items=30, limit=20)
+    covered = [index for _, indexes in batches for index in indexes]
+    assert covered == list(range(30))
+    assert all(len(content) <= 20 for content, _ in batches)
+
+def test_overlong_message_is_truncated():
+    [(content, covered)] = build_digest_batches(["x" * 150], max_items=10, limit=100)
+    assert len(content) == 100 and content.endswith("…")
+    assert covered == [0]
+
+def test_current_cycle_messages_are_never_capped():
+    messages = [f"m{index}" for index in range(60)]
+    batches = build_digest_batches(messages, max_items=25, limit=100)
+    assert [index for _, indexes in batches for index in indexes] == list(range(60))
+    assert "…" not in "".join(content for content, _ in batches)
+
+def test_backlog_over_the_cap_is_summarized_in_a_footer():
+    batches = build_digest_batches([f"m{index}" for index in range(7)], backlog=5, max_items=3, limit=100)
+    assert batches == [(DIGEST_SEPARATOR.join(["m0", "m1", "m2", "…and 2 more earlier updates.", "m5", "m6"]),
+                        [0, 1, 2, 3, 4, 5, 6])]
+
+def test_backlog_within_the_cap_has_no_footer():
+    [(content, covered)] = build_digest_batches(["m0", "m1", "m2"], backlog=2, max_items=3, limit=100)
+    assert content == DIGEST_SEPARATOR.join(["m0", "m1", "m2"])
+    assert covered == [0, 1, 2]
+
+def test_footer_singular():
+    [(content, _)] = build_digest_batches(["m0", "m1"], backlog=2, max_items=1, limit=100)
+    assert content.endswith("…and 1 more earlier update.")
+
+def test_footer_that_does_not_fit_gets_its_own_batch():
+    batches = build_digest_batches(["a" * 90, "b", "c"], backlog=2, max_items=1, limit=100)
+    assert batches == [("a" * 90, [0]), (f"…and 1 more earlier update.{DIGEST_SEPARATOR}c", [1, 2])]
+
+def test_no_messages():
+    assert build_digest_batches([]) == []
+
+def _outbox_row(key: str, created_at: float) -> dict:
+    return {'idempotency_key': key, 'guild_id': 1, 'channel_id': 10, 'content': f"message {key}",
+            'status': OUTBOX_PENDING, 'attempts': 0, 'created_at': created_at, 'next_attempt_at': created_at}
+
+@pytest.mark.asyncio
+async def test_drain_caps_only_catch_up_rows(dispatcher, monkeypatch):
+    monkeypatch.setattr(mainbot, 'DIGEST_MODE', True)
+    cap = mainbot.DIGEST_MAX_ITEMS_PER_CHANNEL
+    now = time.time()
+    old = now - mainbot.DIGEST_BACKLOG_SECONDS - 60
+    rows = [_outbox_row(f"old{index}", old) for index in range(cap + 2)]
+    rows += [_outbox_row(f"new{index}", now) for index in range(cap + 2)]
+    await mainbot.save_snapshot_changes("source", [], [], outbox_rows=rows)
+
+    assert await mainbot.drain_outbox() == len(rows)
+    content = "".join(content for _, _, content, _ in dispatcher.queued)
+    assert f"message old{cap - 1}\n" in content and f"message old{cap}\n" not in content
+    assert "…and 2 more earlier updates." in content
+    assert all(f"message new{index}" in content for index in range(cap + 2))
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+import mainbot
+from mainbot import OUTBOX_CLAIMED, OUTBOX_FAILED, OUTBOX_PENDING, OUTBOX_SENT, OutboxMessage
+
+def _row(key: str, channel_id: int = 10, guild_id: int = 1, created_at: float | None = None) -> dict:
+    now = time.time() if created_at is None else created_at
+    return {'idempotency_key': key, 'guild_id': guild_id, 'channel_id': channel_id, 'content': f"message {key}",
+            'status': OUTBOX_PENDING, 'attempts': 0, 'created_at': now, 'next_attempt_at': now}
+
+async def _enqueue(*rows: dict):
+    await mainbot.save_snapshot_changes("source", [], [], outbox_rows=list(rows))
+
+async def _rows() -> dict[str, OutboxMessage]:
+    async with mainbot.async_session() as session:
+        result = await session.execute(select(OutboxMessage))
+        return {row.idempotency_key: row for row in result.scalars()}
+
+@pytest.mark.asyncio
+async def test_reinserting_an_idempotency_key_is_a_no_op(db):
+    await _enqueue(_row("a"))
+    await _enqueue(_row("a"), _row("b"))
+    assert sorted(await _rows()) == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_drain_claims_whole_channels(dispatcher, monkeypatch):
+    monkeypatch.setattr(mainbot, 'OUTBOX_CHANNELS_PER_DRAIN', 1)
+    await _enqueue(_row("a1", channel_id=10), _row("b1", channel_id=20), _row("a2", channel_id=10))
+
+    assert await mainbot.drain_outbox() == 2
+    rows = await _rows()
+    assert {key for key, row in rows.items() if row.status == OUTBOX_CLAIMED} == {"a1", "a2"}
+    assert rows["b1"].status == OUTBOX_PENDING
+    assert [channel_id for _, channel_id, _, _ in dispatcher.queued] == [10]  # One digest for both rows
+
+    assert await mainbot.drain_outbox() == 1
+    assert [channel_id for _, channel_id, _, _ in dispatcher.queued] == [10, 20]
+    assert await mainbot.drain_outbox() == 0  # Claimed rows are not claimed again
+
+@pytest.mark.asyncio
+async def test_delivered_rows_are_settled_sent(dispatcher):
+    await _enqueue(_row("a"))
+    await mainbot.drain_outbox()
+    [(_, _, _, on_done)] = dispatcher.queued
+    await on_done(True)
+    assert (await _rows())["a"].status == OUTBOX_SENT
+    assert not mainbot.outbox_in_flight
+
+@pytest.mark.asyncio
+async def test_expired_claim_of_a_queued_row_only_renews_the_lease(dispatcher):
+    await _enqueue(_row("a"))
+    await mainbot.drain_outbox()
+    async with mainbot.async_session() as session:
+        async with session.begin():
+            await session.execute(update(OutboxMessage).values(next_attempt_at=time.time() - 1))
+
+    assert await mainbot.drain_outbox() == 0
+    assert len(dispatcher.queued) == 1  # Not queued a second time
+    row = (await _rows())["a"]
+    assert row.status == OUTBOX_CLAIMED and row.next_attempt_at > time.time()
+
+    mainbot.outbox_in_flight.clear()  # As after a restart: the queued copy is gone
+    async with mainbot.async_session() as session:
+        async with session.begin():
+            await session.execute(update(OutboxMessage).values(next_attempt_at=time.time() - 1))
+    assert await mainbot.drain_outbox() == 1
+    assert len(dispatcher.queued) == 2
+
+@pytest.mark.asyncio
+async def test_failed_deliveries_back_off_then_fail(db):
+    await _enqueue(_row("a"))
+    row_id = (await _rows())["a"].id
+    for attempt in range(1, mainbot.OUTBOX_MAX_ATTEMPTS):
+        started = time.time()
+        await mainbot.settle_outbox_rows([row_id], False)
+        row = (await _rows())["a"]
+        assert (row.status, row.attempts) == (OUTBOX_PENDING, attempt)
+        delay = mainbot.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+        assert started + delay <= row.next_attempt_at <= time.time() + delay
+
+    await mainbot.settle_outbox_rows([row_id], False)
+    row = (await _rows())["a"]
+    assert (row.status, row.attempts) == (OUTBOX_FAILED, mainbot.OUTBOX_MAX_ATTEMPTS)
+
+@pytest.mark.asyncio
+async def test_rows_of_a_blocked_channel_are_deferred_without_an_attempt(dispatcher):
+    for _ in range(mainbot.MAX_RETRIES):
+        await mainbot.channel_health.record_failure(1, 10, 'http_error')
+    await _enqueue(_row("a"))
+
+    assert await mainbot.drain_outbox() == 1
+    row = (await _rows())["a"]
+    assert (row.status, row.attempts) == (OUTBOX_PENDING, 0)
+    assert row.next_attempt_at == mainbot.channel_health.blocked_until(1, 10)
+    assert dispatcher.queued == [] and not mainbot.outbox_in_flight
+
+@pytest.mark.asyncio
+async def test_rows_of_a_gone_channel_spend_an_attempt(dispatcher):
+    await mainbot.channel_health.record_failure(1, 10, 'not_found')
+    await _enqueue(_row("a"))
+
+    await mainbot.drain_outbox()
+    row = (await _rows())["a"]
+    assert (row.status, row.attempts) == (OUTBOX_PENDING, 1)
+    assert dispatcher.queued == []
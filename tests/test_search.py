@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import text
+
+import mainbot
+from mainbot import Listing
+
+def _snapshot_row(listing_id: str, **fields) -> dict:
+    role = {"id": listing_id, "company_name": "Acme", "title": "Software Engineer Intern", "url": f"https://acme.test/{listing_id}",
+            "locations": ["New York, NY"], "season": "Summer 2026", "active": True, "date_posted": 1_700_000_000}
+    role.update(fields)
+    return mainbot._snapshot_row("source", listing_id, Listing.from_role(role))
+
+async def _ids(**filters) -> list[str]:
+    return [row['listing_id'] for row in await mainbot.search_listings(**filters)]
+
+async def _document_counts() -> tuple[int, int, int]:
+    async with mainbot.async_session() as session:
+        return tuple([
+            await session.scalar(text(f"SELECT count(*) FROM {table}"))
+            for table in ('listing_snapshots', 'listing_search', 'listing_search_order')
+        ])
+
+@pytest.mark.asyncio
+async def test_index_follows_snapshot_upserts_and_deletes(db):
+    await mainbot.save_snapshot_changes("source", [_snapshot_row("1"), _snapshot_row("2", company_name="Globex", title="Hardware Intern")], [])
+    assert await _ids(company="acme") == ["1"]
+    assert await _document_counts() == (2, 2, 2)
+
+    await mainbot.save_snapshot_changes("source", [_snapshot_row("1", title="Data Science Intern")], [])
+    assert await _ids(keyword="software") == []
+    assert await _ids(keyword="data science") == ["1"]
+
+    await mainbot.save_snapshot_changes("source", [], ["2"])
+    assert await _ids(company="globex") == []
+    assert await _document_counts() == (1, 1, 1)
+
+@pytest.mark.asyncio
+async def test_results_are_newest_first_and_active_only_by_default(db):
+    await mainbot.save_snapshot_changes("source", [
+        _snapshot_row("old", date_posted=1_700_000_000),
+        _snapshot_row("new", date_posted=1_700_100_000),
+        _snapshot_row("closed", date_posted=1_700_200_000, active=False),
+        _snapshot_row("undated", date_posted=None),
+    ], [])
+    assert await _ids() == ["new", "old", "undated"]
+    assert await _ids(active_only=False) == ["closed", "new", "old", "undated"]
+    assert await _ids(active_only=False, limit=2) == ["closed", "new"]
+
+    await mainbot.save_snapshot_changes("source", [_snapshot_row("old", date_posted=1_700_300_000)], [])
+    assert await _ids() == ["old", "new", "undated"]
+
+@pytest.mark.asyncio
+async def test_dense_and_sparse_matches_rank_alike(db, monkeypatch):
+    rows = [_snapshot_row(str(index), company_name="Acme" if index % 2 else "Globex", date_posted=1_700_000_000 + index,
+                          active=index % 3 != 0) for index in range(40)]
+    await mainbot.save_snapshot_changes("source", rows, [])
+    sparse = await _ids(company="acme", limit=25)
+    monkeypatch.setattr(mainbot, 'SEARCH_INDEX_SCAN_MATCHES', 1)
+    assert await _ids(company="acme", limit=25) == sparse
+    assert sparse == [str(index) for index in range(39, -1, -1) if index % 2 and index % 3 != 0]
+
+def test_fts_clause_quotes_every_term():
+    assert mainbot._fts_clause("company", "Jane Street") == 'company : ("jane"* AND "street"*)'
+    assert mainbot._fts_clause("{company title}", 'x" OR title:* NEAR(') == '{company title} : ("x"* AND "or"* AND "title"* AND "near"*)'
+    assert mainbot._fts_clause("company", '"*-^:') is None
+    assert mainbot._fts_clause("company", None) is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("value", ['"', 'AND', 'NOT acme', 'acme OR', 'a"b', '^acme', 'NEAR(acme', '*', 'company:acme'])
+async def test_query_syntax_in_values_is_searched_literally(db, value):
+    await mainbot.save_snapshot_changes("source", [_snapshot_row("1")], [])
+    await mainbot.search_listings(company=value)  # Must not raise an FTS5 syntax error
+
+@pytest.mark.asyncio
+async def test_order_table_is_built_for_an_existing_index(db):
+    await mainbot.save_snapshot_changes("source", [_snapshot_row("1"), _snapshot_row("2", date_posted=1_700_100_000)], [])
+    async with mainbot.engine.begin() as conn:
+        await conn.exec_driver_sql("DROP TABLE listing_search_order")
+    await mainbot.init_db()
+    assert await _document_counts() == (2, 2, 2)
+    assert await _ids() == ["2", "1"]
@@ -0,0 +1,100 @@
+import random
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+import mainbot
+from mainbot import (EVENT_DEACTIVATED, EVENT_NEW, EVENT_REACTIVATED, ROLLUP_ALL, ROLLUP_COMPANY, ROLLUP_SEASON,
+                     STATS_DAILY, STATS_PERIOD_DAY, STATS_PERIOD_MONTH, STATS_PERIOD_WEEK, ListingEventLog,
+                     ListingEventRollup, period_buckets)
+
+NOW = datetime(2026, 10, 15, 12).timestamp()  # A Thursday
+
+def _event_row(kind: str, company: str, season: str | None, occurred_at: float, duplicate: bool = False) -> dict:
+    return {'source': 'source', 'listing_id': str(occurred_at), 'kind': kind, 'company': company, 'season': season,
+            'occurred_at': occurred_at, 'duplicate': duplicate}
+
+async def _append(*rows: dict):
+    await mainbot.save_snapshot_changes("source", [], [], event_rows=list(rows))
+
+async def _rollups() -> dict[tuple[str, str, str, str], int]:
+    async with mainbot.async_session() as session:
+        result = await session.execute(select(ListingEventRollup))
+        return {(row.bucket, row.kind, row.dimension, row.value): row.count for row in result.scalars()}
+
+async def _recount_from_log() -> dict[tuple[str, str, str, str], int]:
+    async with mainbot.async_session() as session:
+        events = (await session.execute(select(ListingEventLog).where(ListingEventLog.duplicate.is_(False)))).scalars()
+        counts = {}
+        for event in events:
+            values = [(ROLLUP_ALL, ''), (ROLLUP_COMPANY, event.company)]
+            values += [(ROLLUP_SEASON, season.strip()) for season in (event.season or '').split(',') if season.strip()]
+            for bucket in period_buckets(datetime.fromtimestamp(event.occurred_at)).values():
+                for dimension, value in values:
+                    key = (bucket, event.kind, dimension, value)
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+@pytest.mark.asyncio
+async def test_rollups_match_the_event_log(db):
+    rng = random.Random(7)
+    rows = [
+        _event_row(rng.choice((EVENT_NEW, EVENT_NEW, EVENT_DEACTIVATED, EVENT_REACTIVATED)),
+                   rng.choice(("Acme", "Globex", "Initech")),
+                   rng.choice((None, "Summer 2026", "Fall 2026", "Summer 2026, Fall 2026")),
+                   NOW - rng.uniform(0, 70 * 24 * 3600), duplicate=rng.random() < 0.2)
+        for _ in range(500)
+    ]
+    for start in range(0, len(rows), 37):  # Several cycles, so rollups are incremented, not just inserted
+        await _append(*rows[start:start + 37])
+
+    rollups = await _rollups()
+    assert rollups == await _recount_from_log()
+
+    # Every week and month equals the sum of its days
+    days = {key: count for key, count in rollups.items() if len(key[0]) == 10}
+    for period in (STATS_PERIOD_WEEK, STATS_PERIOD_MONTH):
+        summed = {}
+        for (day, kind, dimension, value), count in days.items():
+            bucket = period_buckets(datetime.strptime(day, '%Y-%m-%d'))[period]
+            summed[(bucket, kind, dimension, value)] = summed.get((bucket, kind, dimension, value), 0) + count
+        assert summed == {key: count for key, count in rollups.items() if key[0] in {bucket for bucket, *_ in summed}}
+
+@pytest.mark.asyncio
+async def test_duplicates_are_logged_but_not_counted(db):
+    await _append(_event_row(EVENT_NEW, "Acme", "Summer 2026", NOW),
+                  _event_row(EVENT_NEW, "Acme", "Summer 2026", NOW, duplicate=True))
+    async with mainbot.async_session() as session:
+        assert len((await session.execute(select(ListingEventLog))).all()) == 2
+    day = period_buckets(datetime.fromtimestamp(NOW))[STATS_PERIOD_DAY]
+    assert (await _rollups())[(day, EVENT_NEW, ROLLUP_COMPANY, "Acme")] == 1
+
+@pytest.mark.asyncio
+async def test_stats_messages(db):
+    day = 24 * 3600
+    await _append(
+        _event_row(EVENT_NEW, "Acme", "Summer 2026", NOW),
+        _event_row(EVENT_NEW, "Acme", "Summer 2026", NOW - day),
+        _event_row(EVENT_NEW, "Globex", "Fall 2026", NOW - day),
+        _event_row(EVENT_NEW, "Globex", "Fall 2026", NOW - day, duplicate=True),
+        _event_row(EVENT_NEW, "Globex", "Fall 2026", NOW - day, duplicate=True),
+        _event_row(EVENT_DEACTIVATED, "Acme", "Summer 2026", NOW - 2 * day),
+        _event_row(EVENT_NEW, "Initech", None, NOW - 10 * day),  # Previous week, same month
+    )
+
+    assert await mainbot.build_stats_message(STATS_DAILY, STATS_PERIOD_WEEK, NOW) == (
+        "Listing activity per day this week:\n"
+        "`Oct 13` 0 new, 1 closed, 0 reopened\n"
+        "`Oct 14` 2 new, 0 closed, 0 reopened\n"
+        "`Oct 15` 1 new, 0 closed, 0 reopened"
+    )
+    assert await mainbot.build_stats_message(ROLLUP_COMPANY, STATS_PERIOD_WEEK, NOW) == (
+        "Top companies by new listings this week:\n1. **Acme** - 2\n2. **Globex** - 1"
+    )
+    month = await mainbot.build_stats_message(ROLLUP_COMPANY, STATS_PERIOD_MONTH, NOW)
+    assert "**Initech** - 1" in month
+    assert await mainbot.build_stats_message(ROLLUP_SEASON, STATS_PERIOD_DAY, NOW) == (
+        "Top seasons by new listings today:\n1. **Summer 2026** - 1"
+    )
+    assert await mainbot.build_stats_message(STATS_DAILY, STATS_PERIOD_DAY, NOW + 30 * day) == "No listing activity recorded today."
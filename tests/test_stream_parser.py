@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+import mainbot
+from mainbot import JSONArrayStreamParser
+
+ROLES = [
+    {"id": "a1", "company_name": "Café Ünïcode", "title": "Intern – 日本", "locations": ["Zürich"], "active": True},
+    {"id": "b2", "company_name": "Acme", "title": "SWE Intern", "locations": [], "active": False},
+    12,
+    1.5,
+    "x",
+    None,
+    {"id": "c3", "company_name": "🚀 Rockets", "title": "Intern", "active": True},
+]
+
+def _feed_in_chunks(payload: bytes, size: int) -> list:
+    parser = JSONArrayStreamParser()
+    items = []
+    for start in range(0, len(payload), size):
+        items.extend(parser.feed(payload[start:start + size]))
+    items.extend(parser.close())
+    return items
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_items_survive_every_chunk_boundary(size):
+    payload = json.dumps(ROLES, ensure_ascii=False).encode('utf-8')
+    assert _feed_in_chunks(payload, size) == ROLES
+
+def test_multibyte_characters_split_across_chunks():
+    payload = json.dumps([{"id": 1, "title": "日本語"}], ensure_ascii=False).encode('utf-8')
+    split = payload.index("本".encode('utf-8')) + 1  # Inside the character's three bytes
+    parser = JSONArrayStreamParser()
+    items = parser.feed(payload[:split]) + parser.feed(payload[split:]) + parser.close()
+    assert items == [{"id": 1, "title": "日本語"}]
+
+def test_scalar_split_before_its_delimiter_is_not_emitted_early():
+    parser = JSONArrayStreamParser()
+    assert parser.feed(b'[12') == []
+    assert parser.feed(b'34, 5') == [1234]
+    assert parser.feed(b'.25]') == [5.25]
+    assert parser.close() == []
+
+def test_utf8_bom_is_skipped():
+    assert _feed_in_chunks(b'\xef\xbb\xbf[{"id": 1}]', 2) == [{"id": 1}]
+
+def test_empty_array():
+    assert _feed_in_chunks(b' [ ] ', 1) == []
+
+@pytest.mark.parametrize("payload", [
+    b'[{"id": 1}, {"id": 2}',
+    b'[{"id": 1}, {"id": ',
+    b'[12',
+    b'',
+])
+def test_truncated_array_raises(payload):
+    with pytest.raises(json.JSONDecodeError):
+        _feed_in_chunks(payload, 4)
+
+@pytest.mark.parametrize("payload", [
+    b'{"id": 1}',
+    b'[{"id": 1} {"id": 2}]',
+    b'[{"id": 1},, {"id": 2}]',
+    b'[{"id": 1}] [',
+    b'[{"id": 1], ]',
+])
+def test_malformed_array_raises(payload):
+    with pytest.raises(json.JSONDecodeError):
+        _feed_in_chunks(payload, 3)
+
+def test_read_roles_stream_indexes_dicts_with_ids(monkeypatch):
+    monkeypatch.setattr(mainbot, 'STREAM_CHUNK_SIZE', 5)
+    payload = json.dumps(ROLES + [{"title": "no id"}], ensure_ascii=False).encode('utf-8')
+    roles_by_id = mainbot.read_roles_stream(io.BytesIO(payload))
+    assert set(roles_by_id) == {"a1", "b2", "c3"}
+    assert roles_by_id["a1"].company_name == "Café Ünïcode"
+    assert roles_by_id["a1"].locations == ("Zürich",)
+    assert roles_by_id["b2"].active is False
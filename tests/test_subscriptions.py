@@ -0,0 +1,36 @@
+from mainbot import (FILTER_COMPANY, FILTER_LOCATION, FILTER_SEASON, FILTER_SPONSORSHIP, SubscriptionIndex,
+                     listing_attributes)
+
+ROLE = {"company_name": "Acme", "title": "Software Engineer Intern", "locations": ["New York, NY", "Remote"],
+        "season": "Summer 2026", "sponsorship": "Offers Sponsorship"}
+
+def _index(*filters: tuple[int, str, str]) -> SubscriptionIndex:
+    index = SubscriptionIndex()
+    for guild_id, field, value in filters:
+        index.add(guild_id, field, value)
+    return index
+
+def test_guild_matches_when_every_filtered_field_accepts_a_value():
+    index = _index((1, FILTER_SEASON, "summer"), (1, FILTER_LOCATION, "new york"),
+                   (2, FILTER_SEASON, "fall"),
+                   (3, FILTER_SEASON, "summer"), (3, FILTER_SPONSORSHIP, "does not offer sponsorship"))
+    assert index.match(listing_attributes(ROLE)) == {1}
+
+def test_values_of_one_field_are_alternatives():
+    index = _index((1, FILTER_LOCATION, "seattle"), (1, FILTER_LOCATION, "remote"))
+    assert index.match(listing_attributes(ROLE)) == {1}
+
+def test_removed_filters_stop_matching():
+    index = _index((1, FILTER_COMPANY, "acme"), (1, FILTER_SEASON, "fall"))
+    assert index.match(listing_attributes(ROLE)) == set()
+    index.remove(1, FILTER_SEASON, "fall")
+    assert index.match(listing_attributes(ROLE)) == {1}
+    index.clear_guild(1)
+    assert not index.has_filters(1)
+    assert index.match(listing_attributes(ROLE)) == set()
+
+def test_listing_attributes_are_normalized():
+    attributes = listing_attributes(ROLE, matched_companies=set())
+    assert {"summer 2026", "summer", "2026"} <= attributes[FILTER_SEASON]
+    assert {"new york, ny", "new york", "ny", "remote"} <= attributes[FILTER_LOCATION]
+    assert attributes[FILTER_SPONSORSHIP] == {"offers sponsorship"}
@@ -0,0 +1,104 @@
+import time
+
+import discord
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import mainbot
+
+WEBHOOK = (555, "token")
+
+class WebhookStandIn:
+    """Local stand-in for Discord's execute-webhook endpoint, answering with a configurable status and headers"""
+
+    def __init__(self):
+        self.status = 204
+        self.headers = {}
+        self.requests = []  # (path, JSON body)
+
+    async def execute(self, request: web.Request) -> web.Response:
+        self.requests.append((request.path, await request.json()))
+        return web.Response(status=self.status, headers=self.headers)
+
+@pytest_asyncio.fixture
+async def webhook_server(db, monkeypatch):
+    stand_in = WebhookStandIn()
+    app = web.Application()
+    app.router.add_post('/webhooks/{webhook_id}/{token}', stand_in.execute)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setattr(mainbot, 'WEBHOOK_API_BASE', str(server.make_url('')).rstrip('/'))
+    monkeypatch.setattr(mainbot, 'webhook_buckets', {})
+    monkeypatch.setattr(mainbot, 'bot_fallback_bucket', mainbot.TokenBucket(mainbot.GLOBAL_SEND_RATE, mainbot.GLOBAL_SEND_BURST))
+    await mainbot.set_guild_channel(1, 10)
+    await mainbot.set_channel_webhook(1, 10, WEBHOOK)
+    yield stand_in
+    await mainbot.close_http_session()
+    await server.close()
+
+@pytest.fixture
+def bot_sends(monkeypatch):
+    """Messages sent as the bot through the gateway client"""
+    sent = []
+
+    async def send_discord_message(message_content, guild_id, channel_id):
+        sent.append((guild_id, channel_id, message_content))
+        return True
+
+    monkeypatch.setattr(mainbot, 'send_discord_message', send_discord_message)
+    return sent
+
+@pytest.mark.asyncio
+async def test_successful_execution_is_sent(webhook_server, bot_sends):
+    assert await mainbot.send_webhook_message("hello", 1, 10) is True
+    assert webhook_server.requests == [("/webhooks/555/token", {"content": "hello"})]
+    assert bot_sends == []
+
+@pytest.mark.asyncio
+async def test_429_raises_rate_limited_with_retry_after(webhook_server, bot_sends):
+    webhook_server.status = 429
+    webhook_server.headers = {'Retry-After': '1.5'}
+    with pytest.raises(discord.RateLimited) as raised:
+        await mainbot.send_webhook_message("hello", 1, 10)
+    assert raised.value.retry_after == 1.5
+    assert not mainbot.channel_health.is_blocked(1, 10)
+
+@pytest.mark.asyncio
+async def test_exhausted_bucket_pauses_the_next_send(webhook_server, bot_sends):
+    webhook_server.headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset-After': '0.3'}
+    assert await mainbot.send_webhook_message("first", 1, 10) is True
+    started = time.monotonic()
+    await mainbot.webhook_buckets[WEBHOOK[0]].acquire()
+    assert time.monotonic() - started >= 0.25
+
+@pytest.mark.parametrize("status", [401, 404])
+@pytest.mark.asyncio
+async def test_gone_webhook_is_forgotten_and_the_bot_sends(webhook_server, bot_sends, status):
+    webhook_server.status = status
+    assert await mainbot.send_webhook_message("hello", 1, 10) is True
+    assert bot_sends == [(1, 10, "hello")]
+    assert mainbot.guild_config_cache.webhook_for(10) is None
+    assert WEBHOOK[0] not in mainbot.webhook_buckets
+
+    await mainbot.send_webhook_message("again", 1, 10)
+    assert len(webhook_server.requests) == 1  # Later messages go straight to the bot
+
+@pytest.mark.asyncio
+async def test_server_errors_count_against_the_channel(webhook_server, bot_sends):
+    webhook_server.status = 500
+    for _ in range(mainbot.MAX_RETRIES):
+        assert await mainbot.send_webhook_message("hello", 1, 10) is False
+    assert mainbot.channel_health.is_blocked(1, 10) and not mainbot.channel_health.is_gone(1, 10)
+    assert bot_sends == []
+
+@pytest.mark.asyncio
+async def test_bot_fallback_sends_keep_the_bot_rate_limit(webhook_server, bot_sends, monkeypatch):
+    monkeypatch.setattr(mainbot, 'bot_fallback_bucket', mainbot.TokenBucket(rate=10, capacity=1))
+    await mainbot.set_channel_webhook(1, 10, None)
+    started = time.monotonic()
+    for index in range(3):
+        await mainbot.send_webhook_message(f"message {index}", 1, 10)
+    assert time.monotonic() - started >= 0.18
+    assert len(bot_sends) == 3 and webhook_server.requests == []